@@ -0,0 +1,245 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import warnings
+import numpy as np
+from Sudoku_Solver import Sudoku_Puzzle, new_puzzle, parse_puzzle
+
+
+# The bundled puzzles: (name, file in the benchmarks folder, block width)
+CORPORA=[('4x4', '4x4.txt', 2),
+         ('6x6', '6x6.txt', 3),
+         ('9x9_easy', '9x9_easy.txt', 3),
+         ('9x9_medium', '9x9_medium.txt', 3),
+         ('9x9_hard', '9x9_hard.txt', 3),
+         ('9x9_expert', '9x9_expert.txt', 3),
+         ('9x9_guess', '9x9_guess.txt', 3),
+         ('16x16', '16x16.txt', 4),
+         ('16x16_sparse', '16x16_sparse.txt', 4),
+         ('25x25', '25x25.txt', 5),
+         ('25x25_sparse', '25x25_sparse.txt', 5),
+         ('36x36', '36x36.txt', 6),
+         ('36x36_sparse', '36x36_sparse.txt', 6),
+         ('64x64', '64x64.txt', 8),
+         ('100x100', '100x100.txt', 10)]
+
+CORPUS_DIR=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks')
+
+# Puzzles with no solution, checked by check_unsolvable rather than timed
+UNSOLVABLE='unsolvable.txt'
+
+# What cold_start times: solving one puzzle given on the command line in a new process,
+# with the plain Python solver in Sudoku_Quick and with the rules in Sudoku_Puzzle
+COLD_START={'quick': "import sys; from Sudoku_Quick import solve_line; solve_line(sys.argv[1])",
+            'rules': "import sys; from Sudoku_Solver import Sudoku_Puzzle, parse_puzzle; "
+                     "Sudoku_Puzzle(*parse_puzzle(sys.argv[1])).solve_loop()"}
+
+
+def load_corpus(path, block_w):
+    # Reads a file of puzzles, one per line, skipping blank lines and # comments
+
+    grids=[]
+    with open(path) as f:
+        for line in f:
+            line=line.strip()
+            if line and not line.startswith('#'):
+                grids.append(parse_puzzle(line, block_w=block_w)[0])
+    return grids
+
+
+def timed(func, totals, name):
+    # Wraps func so that the time spent in it is added to totals[name]
+
+    def wrapper(*args, **kwargs):
+        start=time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            totals[name]=totals.get(name, 0)+time.perf_counter()-start
+    return wrapper
+
+
+def run_corpus(grids, block_w, repeat=3):
+    # Benchmarks solve_loop on every puzzle of a corpus, with a Sudoku_Large for puzzles past LARGE_SIZE.
+    # Every puzzle is solved repeat times and the fastest is kept as its latency. Then the time spent in
+    # each rule and in solve_step is measured in a separate pass, and the peak memory in another,
+    # so neither slows down the first.
+
+    latencies=[]
+    solved=0
+    for grid in grids:
+        best=None
+        for _ in range(repeat):
+            start=time.perf_counter()
+            puzzle=new_puzzle(grid, block_w)
+            puzzle.solve_loop()
+            elapsed=time.perf_counter()-start
+            best=elapsed if best is None else min(best, elapsed)
+        latencies.append(best)
+        solved+=puzzle.solved
+
+    # Time spent in every rule and in solve_step. Rule 5 calls the other rules while it guesses,
+    # so its time includes theirs.
+    rule_times={}
+    for grid in grids:
+        puzzle=new_puzzle(grid, block_w)
+        # A Sudoku_Large only has solve_step
+        if isinstance(puzzle, Sudoku_Puzzle):
+            puzzle.rule_func_list=[timed(rule, rule_times, rule.__name__) for rule in puzzle.rule_func_list]
+        puzzle.solve_step=timed(puzzle.solve_step, rule_times, 'solve_step')
+        puzzle.solve_loop()
+
+    # The most memory used by any one solve, including building the puzzle
+    peak=0
+    for grid in grids:
+        tracemalloc.start()
+        puzzle=new_puzzle(grid, block_w)
+        puzzle.solve_loop()
+        peak=max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    latencies=np.array(latencies)
+    total=latencies.sum()
+    return {'puzzles': len(grids),
+            'solved': int(solved),
+            'total_s': float(total),
+            'puzzles_per_s': float(len(grids)/total) if total else None,
+            'latency_ms': {'mean': float(latencies.mean()*1000),
+                           'p50': float(np.percentile(latencies, 50)*1000),
+                           'p90': float(np.percentile(latencies, 90)*1000),
+                           'p99': float(np.percentile(latencies, 99)*1000),
+                           'max': float(latencies.max()*1000)},
+            'rule_ms': {name: float(t*1000) for name, t in sorted(rule_times.items())},
+            'peak_memory_kb': peak/1024}
+
+
+def check_unsolvable(path):
+    # Solves every puzzle in a file of puzzles with no solution, each with the block width worked out
+    # from its size, with numpy's warnings raised as errors. Returns a list of the ones that came back
+    # as anything but 'unsolvable' or raised something on the way.
+
+    failures=[]
+    with open(path) as f:
+        lines=[line.strip() for line in f if line.strip() and not line.startswith('#')]
+    for line in lines:
+        grid, block_w = parse_puzzle(line)
+        try:
+            with warnings.catch_warnings(), np.errstate(all='raise'):
+                warnings.simplefilter('error')
+                status=new_puzzle(grid, block_w).solve_loop()
+        except Exception as error:
+            status=repr(error)
+        if status!='unsolvable':
+            failures.append("%s: %s" % (line, status))
+    return failures
+
+
+def cold_start(line, repeat=3):
+    # The time to the first solution in a new Python process, from starting it until it's done,
+    # for every entry of COLD_START. The fastest of repeat tries is kept. That's mostly imports
+    # and setting things up, which is what short-lived processes pay for every puzzle.
+
+    times={}
+    for name, code in COLD_START.items():
+        best=None
+        for _ in range(repeat):
+            start=time.perf_counter()
+            subprocess.run([sys.executable, '-c', code, line], cwd=os.path.dirname(os.path.abspath(__file__)),
+                           check=True)
+            elapsed=time.perf_counter()-start
+            best=elapsed if best is None else min(best, elapsed)
+        times[name]=float(best*1000)
+    return times
+
+
+def compare(results, baseline, threshold):
+    # Compares results with a baseline from an earlier run. Returns a list of regressions:
+    # fewer puzzles solved, or throughput, median latency, or cold start time worse by more than threshold
+    # (a fraction).
+
+    regressions=[]
+    for name, new in results['corpora'].items():
+        old=baseline.get('corpora', {}).get(name)
+        if old is None:
+            continue
+        if new['solved']<old['solved']:
+            regressions.append("%s: solved %d puzzles, was %d" % (name, new['solved'], old['solved']))
+        if old['puzzles_per_s'] and new['puzzles_per_s']<old['puzzles_per_s']*(1-threshold):
+            regressions.append("%s: %.1f puzzles/s, was %.1f" % (name, new['puzzles_per_s'], old['puzzles_per_s']))
+        if new['latency_ms']['p50']>old['latency_ms']['p50']*(1+threshold):
+            regressions.append("%s: median latency %.2f ms, was %.2f ms" %\
+                               (name, new['latency_ms']['p50'], old['latency_ms']['p50']))
+    for name, new in results.get('cold_start_ms', {}).items():
+        old=baseline.get('cold_start_ms', {}).get(name)
+        if old and new>old*(1+threshold):
+            regressions.append("cold start (%s): %.1f ms, was %.1f ms" % (name, new, old))
+    return regressions
+
+
+def main(argv=None):
+    # Runs the benchmarks, writes the results as JSON, and checks them against a baseline if given.
+    # Exits with status 1 if anything got worse than the threshold allows, or a puzzle with no solution wasn't found out.
+
+    parser=argparse.ArgumentParser(description="Benchmark the Sudoku solver on the bundled puzzles.")
+    parser.add_argument('--corpus', action='append', choices=[name for name, path, block_w in CORPORA],
+                        help="Only run this corpus (can be given more than once)")
+    parser.add_argument('--repeat', type=int, default=3, help="Solves of every puzzle to take the fastest of")
+    parser.add_argument('-o', '--output', help="Write the results to this JSON file (default stdout)")
+    parser.add_argument('--baseline', help="A JSON file from an earlier run to compare with")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="How much worse than the baseline counts as a regression, as a fraction")
+    parser.add_argument('--label', help="A label to store with the results, like a commit hash")
+    args=parser.parse_args(argv)
+
+    results={'label': args.label,
+             'python': platform.python_version(),
+             'numpy': np.__version__,
+             'machine': platform.machine(),
+             'corpora': {}}
+    for name, path, block_w in CORPORA:
+        if args.corpus and name not in args.corpus:
+            continue
+        grids=load_corpus(os.path.join(CORPUS_DIR, path), block_w)
+        results['corpora'][name]=run_corpus(grids, block_w, args.repeat)
+        stats=results['corpora'][name]
+        print("%-11s %3d/%-3d solved  %8.1f puzzles/s  p50 %8.2f ms  p99 %8.2f ms  peak %8.0f kB" %\
+              (name, stats['solved'], stats['puzzles'], stats['puzzles_per_s'], stats['latency_ms']['p50'],
+               stats['latency_ms']['p99'], stats['peak_memory_kb']), file=sys.stderr)
+
+    # The puzzles with no solution have to be found out, not solved or crashed on
+    results['unsolvable_failures']=check_unsolvable(os.path.join(CORPUS_DIR, UNSOLVABLE))
+    for failure in results['unsolvable_failures']:
+        print("Not found unsolvable: "+failure, file=sys.stderr)
+
+    # A new process solving the first hard 9x9
+    with open(os.path.join(CORPUS_DIR, '9x9_hard.txt')) as f:
+        line=next(line for line in f if line.strip() and not line.startswith('#'))
+    results['cold_start_ms']=cold_start(line.strip(), args.repeat)
+    print("cold start  "+"  ".join("%s %8.2f ms" % item for item in results['cold_start_ms'].items()), file=sys.stderr)
+
+    text=json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text+'\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions=compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print("Regression: "+regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+    if results['unsolvable_failures']:
+        sys.exit(1)
+
+
+if __name__=="__main__":
+
+    main()
@@ -0,0 +1,303 @@
+import argparse
+import concurrent.futures
+import math
+import os
+import sys
+import numpy as np
+from Sudoku_Solver import Sudoku_Puzzle, get_geometry, algorithm_x, take_choice, format_puzzle
+
+
+class Sudoku_Generator:
+# Makes puzzles with exactly one solution. A full grid is made with Algorithm X, then givens are
+# taken out one at a time in a random order, putting back any whose removal lets the puzzle have
+# another solution. The exact cover matrix of the puzzle is kept up to date as givens come and go,
+# so testing a removal only touches the squares around it instead of starting over.
+
+    def __init__(self, size=9, block_w=3, rng=None, max_nodes=100):
+
+        self.size=size
+        self.block_w=block_w
+        # The most choices Algorithm X may take to show that a removal keeps the solution unique.
+        # Proving that gets very slow on the last few givens of bigger puzzles, so past this
+        # the given is just kept. The puzzles still have one solution, but may not be minimal.
+        self.max_nodes=max_nodes
+        self.geom=get_geometry(size, block_w)
+        self.rng=np.random.default_rng(rng)
+
+
+    def new_solution(self):
+        # Makes a random full grid and resets the puzzle to it, with every square given
+
+        size=self.size
+        # Number the choices in a random order, so Algorithm X tries them in a random order.
+        # Choice label stands for choice order[label] of the geometry, and labels undoes that.
+        self.order=self.rng.permutation(size**3)
+        self.labels=np.argsort(self.order)
+        self.Y=self.geom.cover_cols[self.order].tolist()
+        X={j: set() for j in range(4*size*size)}
+        for r, cols in enumerate(self.Y):
+            for j in cols:
+                X[j].add(r)
+
+        solution=next(algorithm_x(X, self.Y))
+        squares, nums = np.divmod(self.order[solution], size)
+        self.solution=np.zeros(size*size, dtype=int)
+        self.solution[squares]=nums+1
+        self.solution=self.solution.reshape(size, size)
+
+        # Everything is given, so nothing is left to cover
+        self.grid=self.solution.copy()
+        self.X={}
+        # The numbers in every row, column, and block, as bits
+        full=(1<<size)-1
+        self.row_used=[full]*size
+        self.col_used=[full]*size
+        self.block_used=[full]*size
+        return self.solution
+
+
+    def choice(self, row, col, num):
+        # The label of the choice of putting num in square (row, col)
+
+        return int(self.labels[(row*self.size+col)*self.size+num-1])
+
+
+    def remove_given(self, row, col):
+        # Takes the number out of square (row, col) and adds the choices that opens up to X:
+        # every number that can now go in the square, and the number in every blank peer
+        # that can now go there
+
+        num=self.grid[row, col]
+        self.grid[row, col]=0
+        block=self.geom.block_nums[row, col]
+        bit=1<<(num-1)
+        self.row_used[row]&=~bit
+        self.col_used[col]&=~bit
+        self.block_used[block]&=~bit
+
+        # The constraints the number covered are open again
+        for j in self.Y[self.choice(row, col, num)]:
+            self.X[j]=set()
+
+        new=[]
+        used=self.row_used[row]|self.col_used[col]|self.block_used[block]
+        for n in range(1, self.size+1):
+            if not used>>(n-1)&1:
+                new.append(self.choice(row, col, n))
+        for r, c in zip(self.geom.peer_rows[row*self.size+col].tolist(), self.geom.peer_cols[row*self.size+col].tolist()):
+            if self.grid[r, c]==0:
+                used=self.row_used[r]|self.col_used[c]|self.block_used[self.geom.block_nums[r, c]]
+                if not used&bit:
+                    new.append(self.choice(r, c, num))
+        for r in new:
+            for j in self.Y[r]:
+                self.X[j].add(r)
+
+
+    def put_given(self, row, col, num):
+        # Puts num back in square (row, col), taking its choice for good
+
+        take_choice(self.X, self.Y, self.choice(row, col, num))
+        self.grid[row, col]=num
+        bit=1<<(num-1)
+        self.row_used[row]|=bit
+        self.col_used[col]|=bit
+        self.block_used[self.geom.block_nums[row, col]]|=bit
+
+
+    def has_other_solution(self, row, col, num):
+        # Checks whether the puzzle might have a solution without num in the blank square (row, col):
+        # True if it found one or gave up looking after max_nodes, False if there isn't one
+
+        r=self.choice(row, col, num)
+        # If it's the only choice left for one of its constraints, the givens force num back in:
+        # the only number that can go in the square, or the only place for num in a set
+        if any(len(self.X[j])==1 for j in self.Y[r]):
+            return False
+        for j in self.Y[r]:
+            self.X[j].discard(r)
+        solutions=algorithm_x(self.X, self.Y, self.max_nodes)
+        found=next(solutions, False) is not False
+        solutions.close() # Puts X back
+        for j in self.Y[r]:
+            self.X[j].add(r)
+        return found
+
+
+    def minimal_chain(self):
+        # Makes a new full grid and takes out as many givens as it can without the puzzle getting
+        # another solution, trying the squares in a random order. Returns the squares taken out,
+        # in order, as a list of (row, col). Unless has_other_solution gave up on some of them,
+        # taking out any of the givens left after that would give the puzzle more than one solution.
+
+        self.new_solution()
+        removed=[]
+        for square in self.rng.permutation(self.size*self.size).tolist():
+            row, col = divmod(square, self.size)
+            num=self.grid[row, col]
+            self.remove_given(row, col)
+            if self.has_other_solution(row, col, num):
+                self.put_given(row, col, num)
+            else:
+                removed.append((row, col))
+        return removed
+
+
+    def puzzle(self, removed, k):
+        # The puzzle with only the first k squares of removed taken out of the solution
+
+        grid=self.solution.copy()
+        if k:
+            rows, cols = zip(*removed[:k])
+            grid[list(rows), list(cols)]=0
+        return grid
+
+
+    def grade(self, grid):
+        # Grades a puzzle the way solve_loop does. Returns (max_rule, num_steps).
+
+        puzzle=Sudoku_Puzzle(grid, self.block_w)
+        puzzle.solve_loop()
+        return puzzle.max_rule, puzzle.num_steps
+
+
+    def generate(self, max_rule=None, min_steps=0, max_steps=None, tries=100):
+        # Makes a puzzle with exactly one solution that solve_loop grades with the given max_rule,
+        # and num_steps between min_steps and max_steps if they are given.
+        # Every new full grid gives a chain of puzzles, each with one more given taken out than
+        # the one before, and they mostly get harder along the chain. So the last puzzle that isn't
+        # too hard is found by a binary search along the chain, grading only a handful of them.
+        # If that's too easy, the squares after it in the chain are taken out too, skipping any
+        # that make it too hard. Every puzzle with all the givens of the last one in the chain
+        # has the same one solution, so none of that needs checking again.
+        # If nothing fits, it starts again with a new grid.
+        # Returns (grid, max_rule, num_steps), or None if nothing fits after tries grids.
+
+        def too_hard(grade):
+            return (max_rule is not None and grade[0]>max_rule) or\
+                   (max_steps is not None and grade[1]>max_steps)
+
+        def fits(grade):
+            return (max_rule is None or grade[0]==max_rule) and grade[1]>=min_steps
+
+        for _ in range(tries):
+            removed=self.minimal_chain()
+            k=len(removed)
+            grade=self.grade(self.puzzle(removed, k))
+            if too_hard(grade):
+                # The full grid is never too hard, so look for the last puzzle that isn't
+                lo, lo_grade = 0, None
+                while k-lo>1:
+                    mid=(lo+k)//2
+                    mid_grade=self.grade(self.puzzle(removed, mid))
+                    if too_hard(mid_grade):
+                        k=mid
+                    else:
+                        lo, lo_grade = mid, mid_grade
+                k, grade = lo, lo_grade or self.grade(self.puzzle(removed, lo))
+
+            grid=self.puzzle(removed, k)
+            if fits(grade):
+                return grid, grade[0], grade[1]
+
+            # Too easy: removed[k] made it too hard, so carry on with the ones after it
+            for row, col in removed[k+1:]:
+                num=grid[row, col]
+                grid[row, col]=0
+                new_grade=self.grade(grid)
+                if too_hard(new_grade):
+                    grid[row, col]=num
+                    continue
+                if fits(new_grade):
+                    return grid, new_grade[0], new_grade[1]
+        return None
+
+
+def generate_chunk(seed, count, size=9, block_w=3, max_rule=None, min_steps=0, max_steps=None, tries=100,
+                   max_nodes=100):
+    # Makes count puzzles with their own random seed. Used by the workers of generate_many.
+    # Returns (puzzle, max_rule, num_steps) for every puzzle, with None for the puzzle
+    # if nothing fit after tries grids.
+
+    generator=Sudoku_Generator(size, block_w, seed, max_nodes)
+    results=[]
+    for _ in range(count):
+        result=generator.generate(max_rule, min_steps, max_steps, tries)
+        results.append((None, -1, 0) if result is None else (format_puzzle(result[0]), result[1], result[2]))
+    return results
+
+
+def generate_many(count, size=9, block_w=3, max_rule=None, min_steps=0, max_steps=None,
+                  processes=None, chunk_size=16, seed=None, tries=100, max_nodes=100):
+    # Makes count puzzles with a pool of processes and yields the results of generate_chunk
+    # one puzzle at a time as they finish. Every chunk gets its own seed spawned from seed,
+    # so the same seed and chunk size give the same puzzles however many processes there are,
+    # though with more than one they come out in the order they finish.
+
+    processes=processes or os.cpu_count() or 1
+    sizes=[min(chunk_size, count-start) for start in range(0, count, chunk_size)]
+    seeds=np.random.SeedSequence(seed).spawn(len(sizes))
+    args=(size, block_w, max_rule, min_steps, max_steps, tries, max_nodes)
+
+    # Everything in this process if there is only one
+    if processes==1:
+        for chunk_seed, n in zip(seeds, sizes):
+            yield from generate_chunk(chunk_seed, n, *args)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        futures=[pool.submit(generate_chunk, chunk_seed, n, *args) for chunk_seed, n in zip(seeds, sizes)]
+        for future in concurrent.futures.as_completed(futures):
+            yield from future.result()
+
+
+def main(argv=None):
+    # Makes puzzles and writes one per line, followed by their max_rule and num_steps, separated by tabs.
+    # The puzzles are written the way the command line of Sudoku_Solver.py reads them.
+
+    parser=argparse.ArgumentParser(description="Make Sudoku puzzles with exactly one solution.")
+    parser.add_argument('-n', '--count', type=int, default=1, help="The number of puzzles to make")
+    parser.add_argument('--size', type=int, default=9, help="The size of the puzzles")
+    parser.add_argument('--block-w', type=int, help="The block width (default the square root of the size)")
+    parser.add_argument('--rule', type=int, choices=range(6),
+                        help="The highest rule solve_loop should need (default whatever comes out)")
+    parser.add_argument('--min-steps', type=int, default=0, help="The fewest num_steps solve_loop should take")
+    parser.add_argument('--max-steps', type=int, help="The most num_steps solve_loop should take")
+    parser.add_argument('--tries', type=int, default=100, help="Full grids to try for every puzzle before giving up")
+    parser.add_argument('--max-nodes', type=int, default=100,
+                        help="How hard to try to show a given can be taken out before keeping it")
+    parser.add_argument('-j', '--processes', type=int, help="The number of worker processes (default one per CPU)")
+    parser.add_argument('--chunk-size', type=int, default=16, help="The number of puzzles given to a worker at once")
+    parser.add_argument('--seed', type=int, help="Seed for the random numbers, to get the same puzzles again")
+    parser.add_argument('-o', '--output', default='-', help="Where to write the puzzles (default stdout)")
+    args=parser.parse_args(argv)
+
+    block_w=args.block_w
+    if block_w is None:
+        block_w=math.isqrt(args.size)
+        if block_w*block_w!=args.size:
+            parser.error("a block width for a puzzle of size %d has to be given" % args.size)
+    if block_w<1 or args.size%block_w:
+        parser.error("a block width of %d doesn't fit a puzzle of size %d" % (block_w, args.size))
+
+    outfile=sys.stdout if args.output=='-' else open(args.output, 'w')
+    failed=0
+    try:
+        for puzzle, max_rule, num_steps in generate_many(args.count, args.size, block_w, args.rule, args.min_steps,
+                                                         args.max_steps, args.processes, args.chunk_size,
+                                                         args.seed, args.tries, args.max_nodes):
+            if puzzle is None:
+                failed+=1
+            else:
+                outfile.write("%s\t%d\t%d\n" % (puzzle, max_rule, num_steps))
+    finally:
+        if outfile is not sys.stdout:
+            outfile.close()
+    if failed:
+        print("Couldn't make %d of the puzzles" % failed, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__=="__main__":
+
+    main()
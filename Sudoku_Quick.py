@@ -0,0 +1,256 @@
+import argparse
+import functools
+import math
+import sys
+import time
+
+# A solver for puzzles up to 16x16 in plain Python, for short-lived processes where importing numpy
+# and setting up a Sudoku_Puzzle takes longer than solving the puzzle. Nothing in here imports numpy.
+# Bigger puzzles are handed to Sudoku_Solver, which is only imported once one of them comes up.
+# Like solve_exact_cover, it only finds the solution and doesn't grade the puzzle.
+
+
+# The symbols of the numbers above 9 when a puzzle is written with one character per square
+SYMBOLS='123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+# The biggest puzzles solved here. Anything bigger goes to Sudoku_Solver.
+QUICK_SIZE=16
+
+
+def parse_line(line, size=None, block_w=None):
+    # Reads a puzzle written on one line: one character per square with '.' or '0' for blanks and
+    # letters for numbers above 9, or the numbers separated by commas or spaces.
+    # The size is worked out from the length if it isn't given, and the block width is the
+    # square root of the size if it isn't given. Returns a flat list of the numbers, the size, and the block width.
+
+    line=line.strip()
+    if ',' in line or ' ' in line:
+        tokens=line.replace(',', ' ').split()
+        nums=[0 if token=='.' else int(token) if token.isdigit() else SYMBOLS.index(token.upper())+1\
+              for token in tokens]
+    else:
+        nums=[0 if char in '.0' else SYMBOLS.index(char.upper())+1 for char in line]
+
+    if size is None:
+        size=math.isqrt(len(nums))
+    if len(nums)!=size*size:
+        raise ValueError("Expected %d squares but found %d" % (size*size, len(nums)))
+    if block_w is None:
+        block_w=math.isqrt(size)
+        if block_w*block_w!=size:
+            raise ValueError("A block width for a puzzle of size %d has to be given" % size)
+    if block_w<1 or size%block_w:
+        raise ValueError("A block width of %d doesn't fit a puzzle of size %d" % (block_w, size))
+    if max(nums)>size:
+        raise ValueError("Number bigger than the size of the puzzle")
+
+    return nums, size, block_w
+
+
+def format_line(nums, size):
+    # Writes a flat list of numbers out on one line the way parse_line reads it
+
+    if size<=len(SYMBOLS):
+        return ''.join('.' if num==0 else SYMBOLS[num-1] for num in nums)
+    return ','.join(str(num) for num in nums)
+
+
+@functools.lru_cache(maxsize=None)
+def layout(size, block_w):
+    # The squares (numbered row*size+col) of every set, in the order rows, columns, blocks,
+    # and the numbers of the three sets of every square
+
+    block_h=size//block_w
+    sets=[[row*size+col for col in range(size)] for row in range(size)]
+    sets+=[[row*size+col for row in range(size)] for col in range(size)]
+    # Block b starts in row block_h*(b//block_h) and column block_w*(b%block_h)
+    sets+=[[(block_h*(b//block_h)+i//block_w)*size+block_w*(b%block_h)+i%block_w for i in range(size)]
+           for b in range(size)]
+    square_sets=[None]*(size*size)
+    for row in range(size):
+        for col in range(size):
+            square_sets[row*size+col]=(row, size+col, 2*size+block_h*(row//block_h)+col//block_w)
+    return sets, square_sets
+
+
+def propagate(grid, used, size, block_w):
+    # Fills in squares with only one candidate and numbers with only one square left in a set, over and
+    # over until there are none left. used holds the numbers filled in in every set as bits.
+    # Returns False if it runs into a contradiction.
+
+    sets, square_sets = layout(size, block_w)
+    full=(1<<size)-1
+    while True:
+        filled=False
+
+        # Squares with only one candidate
+        for square, (row, col, block) in enumerate(square_sets):
+            if grid[square]:
+                continue
+            cand=full&~(used[row]|used[col]|used[block])
+            if not cand:
+                return False
+            if not cand&(cand-1):
+                grid[square]=cand.bit_length()
+                used[row]|=cand
+                used[col]|=cand
+                used[block]|=cand
+                filled=True
+
+        # Numbers with only one square left in a set: the candidates seen once but not twice
+        for unit, squares in enumerate(sets):
+            once=twice=0
+            for square in squares:
+                if not grid[square]:
+                    row, col, block = square_sets[square]
+                    cand=full&~(used[row]|used[col]|used[block])
+                    twice|=once&cand
+                    once|=cand
+            if (once|used[unit])!=full:
+                return False # A number that can't go anywhere in the set
+            singles=once&~twice
+            while singles:
+                bit=singles&-singles
+                singles^=bit
+                for square in squares:
+                    row, col, block = square_sets[square]
+                    if not grid[square] and not (used[row]|used[col]|used[block])&bit:
+                        grid[square]=bit.bit_length()
+                        used[row]|=bit
+                        used[col]|=bit
+                        used[block]|=bit
+                        filled=True
+                        break
+                else:
+                    return False # Its only square got filled in with something else
+        if not filled:
+            return True
+
+
+def search(grid, size, block_w, deadline=None):
+    # Solves a flat list of numbers with propagate, guessing on the blank square with the fewest
+    # candidates when it gets stuck. Uses its own stack of (grid, used) instead of recursing.
+    # Returns the solved grid, or None if there is no solution. Raises TimeoutError if it's still
+    # going at deadline, a time.perf_counter() value.
+
+    sets, square_sets = layout(size, block_w)
+    full=(1<<size)-1
+    used=[0]*(3*size)
+    for square, num in enumerate(grid):
+        if num:
+            bit=1<<(num-1)
+            for unit in square_sets[square]:
+                if used[unit]&bit:
+                    return None # The same number twice in a set
+                used[unit]|=bit
+
+    stack=[(list(grid), used)]
+    while stack:
+        if deadline is not None and time.perf_counter()>=deadline:
+            raise TimeoutError("Ran out of time")
+        grid, used = stack.pop()
+        if not propagate(grid, used, size, block_w):
+            continue
+
+        best, fewest = None, size+1
+        for square, (row, col, block) in enumerate(square_sets):
+            if not grid[square]:
+                count=bin(full&~(used[row]|used[col]|used[block])).count('1')
+                if count<fewest:
+                    best, fewest = square, count
+                    if count==2:
+                        break
+        if best is None:
+            return grid
+
+        # The lowest candidate goes on the stack last, so it gets tried first
+        row, col, block = square_sets[best]
+        cand=full&~(used[row]|used[col]|used[block])
+        bits=[]
+        while cand:
+            bits.append(cand&-cand)
+            cand^=bits[-1]
+        for bit in reversed(bits):
+            new_grid, new_used = list(grid), list(used)
+            new_grid[best]=bit.bit_length()
+            for unit in square_sets[best]:
+                new_used[unit]|=bit
+            stack.append((new_grid, new_used))
+    return None
+
+
+def solve_grid(grid, block_w=None, timeout=None):
+    # Solves a puzzle given as a list of rows (or anything like it, such as a numpy array) with 0 for blanks.
+    # The block width is the square root of the size if it isn't given.
+    # Returns the solution as a list of rows, and whether it was solved. Puzzles bigger than QUICK_SIZE
+    # are solved by Sudoku_Solver: the ones it solves with Sudoku_Puzzle with exact cover, the rest with Sudoku_Large.
+    # Raises TimeoutError if it takes more than timeout seconds.
+
+    rows=[[int(num) for num in row] for row in grid]
+    size=len(rows)
+    if block_w is None:
+        block_w=math.isqrt(size)
+        if block_w*block_w!=size:
+            raise ValueError("A block width for a puzzle of size %d has to be given" % size)
+
+    if size>QUICK_SIZE:
+        import Sudoku_Solver
+        puzzle=Sudoku_Solver.new_puzzle(rows, block_w)
+        solved=puzzle.solve('exact_cover' if isinstance(puzzle, Sudoku_Solver.Sudoku_Puzzle) else 'rules',
+                            timeout=timeout)
+        if puzzle.status=='budget_exhausted':
+            raise TimeoutError("Ran out of time")
+        return puzzle.grid.tolist(), solved
+
+    deadline=None if timeout is None else time.perf_counter()+timeout
+    solution=search([num for row in rows for num in row], size, block_w, deadline)
+    if solution is None:
+        return rows, False
+    return [solution[row*size:(row+1)*size] for row in range(size)], True
+
+
+def solve_line(line, size=None, block_w=None):
+    # Solves a puzzle written on one line. Returns the solution written the same way, and whether it was solved.
+
+    nums, size, block_w = parse_line(line, size, block_w)
+    solution, solved = solve_grid([nums[row*size:(row+1)*size] for row in range(size)], block_w)
+    return format_line([num for row in solution for num in row], size), solved
+
+
+def main(argv=None):
+    # Solves a file of puzzles one per line like the command line of Sudoku_Solver.py, writing the
+    # number, solution, whether it was solved, num_steps, and max_rule of every puzzle separated by tabs.
+    # Nothing is graded, so num_steps and max_rule are always 0, the same as with --method exact_cover.
+
+    parser=argparse.ArgumentParser(description="Quickly solve a file of Sudoku puzzles, one per line.")
+    parser.add_argument('input', help="The file of puzzles, or - for stdin")
+    parser.add_argument('-o', '--output', default='-', help="Where to write the solutions (default stdout)")
+    parser.add_argument('--size', type=int, help="The size of the puzzles (default from the length of each line)")
+    parser.add_argument('--block-w', type=int, help="The block width (default the square root of the size)")
+    args=parser.parse_args(argv)
+
+    infile=sys.stdin if args.input=='-' else open(args.input)
+    outfile=sys.stdout if args.output=='-' else open(args.output, 'w')
+    try:
+        num=0
+        for line in infile:
+            line=line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                solution, solved = solve_line(line, args.size, args.block_w)
+                max_rule=0
+            except ValueError as error:
+                solution, solved, max_rule = "error: %s" % error, False, -1
+            outfile.write("%d\t%s\t%d\t0\t%d\n" % (num, solution, solved, max_rule))
+            num+=1
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+
+
+if __name__=="__main__":
+
+    main()
@@ -0,0 +1,458 @@
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import os
+import sys
+import time
+import numpy as np
+from Sudoku_Quick import parse_line, format_line, layout, solve_grid
+from Sudoku_Solver import Sudoku_Puzzle, Sudoku_Batch, Sudoku_Large, LARGE_SIZE, Solve_Interrupted
+
+
+# The requests that get solved in batches, and the one that's answered right away
+BATCHED=('solve', 'grade', 'count')
+MAX_BODY=64*1024*1024 # The biggest request body read, enough for a 1000x1000 written out
+MAX_LIMIT=100 # The most solutions /count looks for
+REASONS={200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+         413: 'Payload Too Large', 422: 'Unprocessable Entity', 503: 'Service Unavailable'}
+# What's sent back for a puzzle that ran out of time
+OUT_OF_TIME={'error': "Ran out of time", 'status': 'budget_exhausted'}
+
+
+def read_puzzle(request):
+    # The puzzle of a request: 'puzzle' is either one line the way parse_line reads it or a list of rows,
+    # with 'size' and 'block_w' if they can't be worked out. Returns (numbers as a flat list, size, block_w),
+    # or raises ValueError if it can't be read.
+
+    puzzle=request.get('puzzle')
+    if isinstance(puzzle, list):
+        # Written out with commas, so parse_line does all the checking
+        puzzle=','.join(str(int(num)) for row in puzzle for num in row)
+    if not isinstance(puzzle, str):
+        raise ValueError("'puzzle' has to be a line or a list of rows")
+    return parse_line(puzzle, request.get('size'), request.get('block_w'))
+
+
+def clashes(nums, size, block_w):
+    # Whether any number is filled in twice in a row, column, or block
+
+    sets, square_sets = layout(size, block_w)
+    for squares in sets:
+        filled=[nums[square] for square in squares if nums[square]]
+        if len(filled)!=len(set(filled)):
+            return True
+    return False
+
+
+def run_batch(kind, size, block_w, puzzles, limit=2, timeout=None):
+    # Does one kind of request for a list of puzzles of the same size and block width, given as flat lists.
+    # Used by the workers of Sudoku_Server. Returns a dict to send back for every puzzle:
+    # 'solve' gives the solution and whether it was solved, 'grade' adds num_steps and max_rule the way
+    # solve_loop grades them, and 'count' gives the number of solutions, up to limit.
+    # Every puzzle gets timeout seconds, and the ones that run out get OUT_OF_TIME instead.
+
+    if kind=='solve':
+        results=[]
+        for nums in puzzles:
+            try:
+                solution, solved = solve_grid([nums[row*size:(row+1)*size] for row in range(size)], block_w,
+                                              timeout)
+            except TimeoutError:
+                results.append(OUT_OF_TIME)
+                continue
+            results.append({'solution': format_line([num for row in solution for num in row], size),
+                            'solved': solved})
+        return results
+
+    grids=np.array(puzzles).reshape(len(puzzles), size, size)
+    if kind=='grade':
+        if size>LARGE_SIZE:
+            puzzles=[Sudoku_Large(grid, block_w) for grid in grids]
+            status=[puzzle.solve_loop(timeout=timeout) for puzzle in puzzles]
+            solution=[puzzle.grid for puzzle in puzzles]
+            solved=[puzzle.solved for puzzle in puzzles]
+            max_rule=[puzzle.max_rule for puzzle in puzzles]
+            num_steps=[puzzle.num_steps for puzzle in puzzles]
+        else:
+            # A batch is never more than max_batch puzzles, so there's no need for solve_batch's chunks
+            batch=Sudoku_Batch(grids, block_w)
+            batch.solve_loop(timeout=timeout)
+            solution, solved, max_rule, num_steps, status =\
+                batch.grid, batch.solved, batch.max_rule, batch.num_steps, batch.status
+        return [OUT_OF_TIME if status[k]=='budget_exhausted' else
+                {'solution': format_line(np.ravel(solution[k]).tolist(), size), 'solved': bool(solved[k]),
+                 'num_steps': int(num_steps[k]), 'max_rule': int(max_rule[k])} for k in range(len(grids))]
+
+    if kind=='count':
+        results=[]
+        for grid in grids:
+            try:
+                results.append({'count': Sudoku_Puzzle(grid, block_w).count_solutions(limit, timeout),
+                                'limit': limit})
+            except Solve_Interrupted:
+                results.append(OUT_OF_TIME)
+        return results
+
+    raise ValueError("Unknown kind of request %r" % kind)
+
+
+def percentiles(values):
+    # The mean, median, 90th and 99th percentile, and biggest of a list of numbers, or None if it's empty
+
+    if not values:
+        return None
+    values=np.array(values)
+    return {'mean': float(values.mean()), 'p50': float(np.percentile(values, 50)),
+            'p90': float(np.percentile(values, 90)), 'p99': float(np.percentile(values, 99)),
+            'max': float(values.max())}
+
+
+class Sudoku_Server:
+# A local HTTP server that takes puzzles as JSON and solves them, without anything from outside this machine.
+# POST /solve, /grade, /validate, and /count with {"puzzle": ..., "size": ..., "block_w": ...} (and "limit"
+# for /count), and GET /metrics. Instead of making a puzzle object for every request, the requests that
+# come in within max_wait seconds of each other are put together in batches of up to max_batch and handed
+# to a pool of worker processes, puzzles of the same size and kind together, so grading goes through
+# Sudoku_Batch. Requests wait in a queue of at most max_queue, and only as many batches as there are workers
+# are handed out at once, so when it can't keep up the queue fills and new requests get a 503 with
+# Retry-After straight away instead of piling up. Every puzzle gets timeout seconds on a worker, and the
+# ones that run out get a 422, so one hard puzzle can only hold up its batch for so long.
+
+    def __init__(self, processes=None, max_batch=64, max_wait=0.002, max_queue=1024, window=10000, timeout=10):
+        # processes=0 solves the batches in a thread of this process instead of a pool.
+        # The latency metrics cover the last window requests. timeout=None gives puzzles as long as they take.
+
+        self.processes=(os.cpu_count() or 1) if processes is None else processes
+        self.max_batch=max_batch
+        self.max_wait=max_wait
+        self.max_queue=max_queue
+        self.timeout=timeout
+        self.queue=None
+        self.pool=None
+        self.workers=None # Limits the batches being solved to the number of workers
+        self.server=None
+
+        # Metrics
+        self.started=time.time()
+        self.requests=collections.Counter() # Answered requests by kind
+        self.errors=0 # Requests that couldn't be read
+        self.rejected=0 # Requests turned away because the queue was full
+        self.timeouts=0 # Requests whose puzzle ran out of time
+        self.batches=0
+        self.batched=0 # The requests in all the batches together
+        self.in_flight=0 # Batches being solved right now
+        self.max_depth=0 # The longest the queue has been
+        self.latencies=collections.deque(maxlen=window) # Seconds from reading a request to answering it
+        self.waits=collections.deque(maxlen=window) # Seconds requests spent in the queue
+        self.batch_sizes=collections.deque(maxlen=window)
+
+
+    async def start(self, host='127.0.0.1', port=8080):
+        # Starts listening and working through the queue. Returns the asyncio server.
+
+        self.queue=asyncio.Queue(self.max_queue)
+        workers=max(self.processes, 1)
+        self.workers=asyncio.Semaphore(workers)
+        if self.processes:
+            self.pool=concurrent.futures.ProcessPoolExecutor(self.processes)
+        else:
+            self.pool=concurrent.futures.ThreadPoolExecutor(1)
+        self.batcher=asyncio.ensure_future(self.make_batches())
+        self.server=await asyncio.start_server(self.handle_connection, host, port)
+        return self.server
+
+
+    async def close(self):
+        # Stops listening and shuts the workers down
+
+        self.server.close()
+        await self.server.wait_closed()
+        self.batcher.cancel()
+        self.pool.shutdown(cancel_futures=True)
+
+
+    async def make_batches(self):
+        # Takes requests off the queue in batches: once one comes in, waits max_wait for more
+        # (unless there are already enough), then hands out everything that's there, up to max_batch
+
+        loop=asyncio.get_running_loop()
+        while True:
+            batch=[await self.queue.get()]
+            if self.queue.qsize()<self.max_batch-1:
+                await asyncio.sleep(self.max_wait)
+            while len(batch)<self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            # Puzzles of the same kind, size, and block width (and limit, for counting) go together
+            groups={}
+            for item in batch:
+                groups.setdefault(item[0], []).append(item)
+            for key, items in groups.items():
+                await self.workers.acquire()
+                self.in_flight+=1
+                asyncio.ensure_future(self.run(loop, key, items))
+
+
+    async def run(self, loop, key, items):
+        # Solves one group of requests on a worker and answers all of them
+
+        kind, size, block_w, limit = key
+        now=time.perf_counter()
+        self.batches+=1
+        self.batched+=len(items)
+        self.batch_sizes.append(len(items))
+        self.waits.extend(now-item[3] for item in items)
+        try:
+            results=await loop.run_in_executor(self.pool, run_batch, kind, size, block_w,
+                                               [item[1] for item in items], limit, self.timeout)
+            for item, result in zip(items, results):
+                if not item[2].done():
+                    item[2].set_result(result)
+        except Exception as error:
+            for item in items:
+                if not item[2].done():
+                    item[2].set_exception(error)
+        finally:
+            self.in_flight-=1
+            self.workers.release()
+
+
+    async def handle(self, method, path, body):
+        # Answers one request. Returns (status, dict to send back as JSON).
+
+        kind=path.strip('/')
+        if kind=='metrics':
+            if method!='GET':
+                return 405, {'error': "Use GET for /metrics"}
+            return 200, self.get_metrics()
+        if kind not in BATCHED and kind!='validate':
+            return 404, {'error': "No such endpoint %s" % path}
+        if method!='POST':
+            return 405, {'error': "Use POST for %s" % path}
+
+        try:
+            request=json.loads(body or b'{}')
+            if not isinstance(request, dict):
+                raise ValueError("The request has to be a JSON object")
+            nums, size, block_w = read_puzzle(request)
+            limit=int(request.get('limit', 2))
+            if not 1<=limit<=MAX_LIMIT:
+                raise ValueError("'limit' has to be from 1 to %d" % MAX_LIMIT)
+        except (ValueError, TypeError) as error:
+            self.errors+=1
+            return 400, {'error': str(error)}
+
+        if kind=='validate':
+            # Cheap enough to answer right here
+            clash=clashes(nums, size, block_w)
+            return 200, {'valid': not clash, 'size': size, 'block_w': block_w,
+                         'error': "A number is filled in twice in a set" if clash else None}
+        if kind=='count' and size>LARGE_SIZE:
+            self.errors+=1
+            return 400, {'error': "Solutions can only be counted up to %dx%d" % (LARGE_SIZE, LARGE_SIZE)}
+
+        if self.queue.full():
+            self.rejected+=1
+            return 503, {'error': "Too many requests waiting, try again later"}
+        future=asyncio.get_running_loop().create_future()
+        self.queue.put_nowait(((kind, size, block_w, limit if kind=='count' else None), nums, future,
+                               time.perf_counter()))
+        self.max_depth=max(self.max_depth, self.queue.qsize())
+        try:
+            result=await future
+        except Exception as error:
+            return 400, {'error': "%s: %s" % (type(error).__name__, error)}
+        if 'error' in result:
+            self.timeouts+=1
+            return 422, result
+        return 200, result
+
+
+    async def handle_connection(self, reader, writer):
+        # Reads HTTP/1.1 requests off a connection and answers them, one at a time, until it's closed
+
+        try:
+            while True:
+                line=await reader.readline()
+                if not line:
+                    break
+                parts=line.decode('latin-1').split()
+                if len(parts)!=3:
+                    break
+                method, path, version = parts
+                headers={}
+                while True:
+                    line=await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()]=value.strip()
+
+                start=time.perf_counter()
+                try:
+                    length=int(headers.get('content-length', 0))
+                except ValueError:
+                    length=-1
+                # Without a length that makes sense there's no telling where the body ends, so the connection is closed
+                if length<0:
+                    self.errors+=1
+                    status, result = 400, {'error': "Bad Content-Length %r" % headers['content-length']}
+                    keep_alive=False
+                elif length>MAX_BODY:
+                    status, result = 413, {'error': "The request is bigger than %d bytes" % MAX_BODY}
+                    keep_alive=False
+                else:
+                    body=await reader.readexactly(length) if length else b''
+                    status, result = await self.handle(method, path, body)
+                    keep_alive=headers.get('connection', '').lower()!='close' and version=='HTTP/1.1'
+
+                data=json.dumps(result).encode()
+                head=["HTTP/1.1 %d %s" % (status, REASONS[status]),
+                      "Content-Type: application/json",
+                      "Content-Length: %d" % len(data),
+                      "Connection: %s" % ('keep-alive' if keep_alive else 'close')]
+                if status==503:
+                    head.append("Retry-After: 1")
+                writer.write(('\r\n'.join(head)+'\r\n\r\n').encode('latin-1')+data)
+                await writer.drain()
+                if status==200:
+                    self.requests[path.strip('/')]+=1
+                    self.latencies.append(time.perf_counter()-start)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+    def get_metrics(self):
+        # How the server is doing: the requests answered, turned away, and waiting, the batches,
+        # and the latency and time in the queue of recent requests, in milliseconds
+
+        latencies=[t*1000 for t in self.latencies]
+        waits=[t*1000 for t in self.waits]
+        return {'uptime_s': time.time()-self.started,
+                'requests': dict(self.requests),
+                'errors': self.errors,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'timeout_s': self.timeout,
+                'queue_depth': self.queue.qsize(),
+                'max_queue_depth': self.max_depth,
+                'max_queue': self.max_queue,
+                'in_flight_batches': self.in_flight,
+                'workers': max(self.processes, 1),
+                'batches': self.batches,
+                'mean_batch_size': self.batched/self.batches if self.batches else None,
+                'max_batch_size': max(self.batch_sizes) if self.batch_sizes else None,
+                'latency_ms': percentiles(latencies),
+                'queue_wait_ms': percentiles(waits)}
+
+
+async def post(reader, writer, host, path, request):
+    # Sends one request on an open connection and reads the answer. Returns (status, dict it sent back).
+
+    data=json.dumps(request).encode()
+    writer.write(("POST %s HTTP/1.1\r\nHost: %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n"
+                  % (path, host, len(data))).encode('latin-1')+data)
+    await writer.drain()
+    status=int((await reader.readline()).split()[1])
+    length=0
+    while True:
+        line=await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower()=='content-length':
+            length=int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def load_test(lines, host='127.0.0.1', port=8080, kind='grade', concurrency=64):
+    # Sends every puzzle line to a running server from concurrency connections at once, each sending
+    # its next puzzle as soon as it gets an answer. Returns the requests per second, the latency
+    # in milliseconds, and how many were answered, turned away, or failed.
+
+    todo=collections.deque(lines)
+    latencies=[]
+    statuses=collections.Counter()
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while todo:
+                line=todo.popleft()
+                start=time.perf_counter()
+                status, result = await post(reader, writer, host, '/'+kind, {'puzzle': line})
+                latencies.append((time.perf_counter()-start)*1000)
+                statuses[status]+=1
+        finally:
+            writer.close()
+
+    start=time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(min(concurrency, len(lines)))])
+    elapsed=time.perf_counter()-start
+    return {'requests': len(latencies),
+            'requests_per_s': len(latencies)/elapsed if elapsed else None,
+            'ok': statuses[200],
+            'rejected': statuses[503],
+            'failed': sum(count for status, count in statuses.items() if status not in (200, 503)),
+            'latency_ms': percentiles(latencies)}
+
+
+async def serve(args):
+    # Runs a server until it's interrupted
+
+    server=Sudoku_Server(args.processes, args.max_batch, args.max_wait/1000, args.max_queue,
+                         timeout=args.timeout or None)
+    await server.start(args.host, args.port)
+    print("Listening on http://%s:%d" % (args.host, args.port), file=sys.stderr)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    # Runs a server, or load tests one that's already running with a file of puzzles
+
+    parser=argparse.ArgumentParser(description="Solve Sudoku puzzles over HTTP on this machine.")
+    subparsers=parser.add_subparsers(dest='command', required=True)
+    serve_parser=subparsers.add_parser('serve', help="Run the server")
+    serve_parser.add_argument('--host', default='127.0.0.1', help="The address to listen on (default only this machine)")
+    serve_parser.add_argument('--port', type=int, default=8080)
+    serve_parser.add_argument('-j', '--processes', type=int,
+                              help="The number of worker processes (default one per CPU, 0 for none)")
+    serve_parser.add_argument('--max-batch', type=int, default=64, help="The most requests solved in one batch")
+    serve_parser.add_argument('--max-wait', type=float, default=2, help="How long to wait for a batch to fill up, in ms")
+    serve_parser.add_argument('--max-queue', type=int, default=1024,
+                              help="The most requests waiting before new ones are turned away")
+    serve_parser.add_argument('--timeout', type=float, default=10,
+                              help="The seconds a puzzle gets before it's answered with an error, 0 for no limit")
+    load_parser=subparsers.add_parser('load', help="Load test a running server with a file of puzzles")
+    load_parser.add_argument('input', help="The file of puzzles, one per line")
+    load_parser.add_argument('--host', default='127.0.0.1')
+    load_parser.add_argument('--port', type=int, default=8080)
+    load_parser.add_argument('--kind', choices=['solve', 'grade', 'validate', 'count'], default='grade')
+    load_parser.add_argument('-c', '--concurrency', type=int, default=64, help="The number of connections at once")
+    load_parser.add_argument('--repeat', type=int, default=1, help="Send every puzzle this many times")
+    args=parser.parse_args(argv)
+
+    if args.command=='serve':
+        try:
+            asyncio.run(serve(args))
+        except KeyboardInterrupt:
+            pass
+    else:
+        with open(args.input) as f:
+            lines=[line.strip() for line in f if line.strip() and not line.startswith('#')]
+        stats=asyncio.run(load_test(lines*args.repeat, args.host, args.port, args.kind, args.concurrency))
+        print(json.dumps(stats, indent=2))
+
+
+if __name__=="__main__":
+
+    main()
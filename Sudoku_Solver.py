@@ -1,543 +1,2508 @@
-import itertools as it
-import numpy as np
-
-
-
-class Sudoku_Puzzle:
-# Define the Sudoku Puzzle object with all the variables and functions
-# used to solve the puzzle
-   
-    def __init__(self, grid=np.zeros((9,9)), block_w=3):
-        # Check and initialize parameters and variables used in the solving process.
-        # The grid containing the puzzle values and the number of squares in the
-        # width of each block should be given when the object is created.
-        
-        self.grid=np.array(grid).copy() # The 2x2 array containing the starting values from the puzzle
-        self.size=self.grid.shape[0] # The side length of the grid and the number of numbers
-        self.block_w=block_w
-        
-       
-        # Only the width needs to be entered because the dimensions of the blocks
-        # are constrained such that the product is the grid size.
-        # Initialize the block height.
-        self.block_h=self.size//self.block_w
-        
-        self.inds=np.arange(self.size) # A list of nummbers up to self.size. Commonly used.            
-            
-        # Create grids with elements containg the row, column, or block number for each square.
-        # Used for slicing out a row or block from cands or with just the row/block number.
-        self.row_nums=np.zeros((self.size, self.size))
-        self.col_nums=np.zeros((self.size, self.size))
-        self.block_nums=np.zeros((self.size, self.size))
-        for i in range(self.size):
-            self.row_nums[i]=i
-            self.col_nums[:,i]=i
-            self.block_nums[self.block_h*(i//self.block_h):self.block_h*(i//self.block_h+1),\
-                            self.block_w*(i%self.block_h):self.block_w*(i%self.block_h+1)]=i
-            
-            
-        # Initialize candidates
-        self.cands=np.ones((self.size,self.size,self.size))
-        self.prev_cands=self.cands.copy()
-
-        # Initialize variables for Rule 4
-        self.rule_4_count=0 # The number of times Rule 4 has been called
-        self.current_cands=self.cands.copy() # The state of cands before Rule 4 was called the first time
-        self.current_grid=self.grid.copy() # The state of grid before Rule 4 was called the first time
-        self.guess_row=0 # The row index of the current square used for guessing
-        self.guess_col=0 # The column index of the current square used for guessing
-        self.guess_nums=np.zeros((2)) # The candidates of the current square used for guessing
-        # The lists of rows and columns for squares containing two candidates
-        self.pairs_rows, self.pairs_cols = np.array([]), np.array([]) 
-        
-        # Initialize a counter for the number of solve steps taken to solve the puzzle 
-        self.num_steps=0
-        # Keep track of the highest level Rule needed to solve the puzzle
-        self.max_rule=0        
-        # Initialize the state of being solved
-        self.solved=False
-        
-        # Create a list of the Rule functions
-        self.rule_func_list=[self.Rule_0, 
-                             self.Rule_1,
-                             self.Rule_2,
-                             self.Rule_3,
-                             self.Rule_4]
-                
-    
-    def Block_num(self, i, j):
-        # Calculates the block number of a square based on its row and column number
-        
-        return self.block_h*(i//self.block_h)+j//self.block_w
-
-    
-    def Rule_0(self):
-        # Applies Rule 0 to the entire grid.
-        # Rule 0: Eliminate candidates of squares if there is already a square in that 
-        # row, column, or block with a solved number
-
-        for i in range(self.size):
-            for j in range(self.size):
-
-                num=self.grid[i,j]
-
-                # If the sqaure already has a value, there are no other potential candidates
-                if num!=0:
-                    self.cands[i,j,:]=0 # set all candidate values to zero
-
-                else:
-                    # Isolate the other values currently in the sqaure's row, column, and block
-                    row=self.grid[i]
-                    col=self.grid[:,j]
-                    block=self.grid[self.block_nums==self.Block_num(i, j)]
-
-                    # The different numbers in the row, column, and block
-                    # is the list of candidates to remove from that square
-                    notslist=np.unique(np.concatenate([row,col,block]))
-                    # Zero represents a blank square so it doesn't need to be removed
-                    # as a candidate
-                    notslist=notslist[notslist!=0]
-
-                    # Set the cadidate list to zero in the position corresponding to the value
-                    # already in that row, column, or block
-                    if notslist.size>0:
-                        self.cands[i,j,notslist-1]=0
-                    
-    
-    
-    def Rule_1_columns(self, transpose=False):
-        # Applies Rule 1 to all the columns the entire grid
-        # Nearly the same code is used to apply Rule 1 to all the rows, 
-        # so the transpose of the cands array can be used with the same function.
-        
-        # When the blocks aren't square, the simple transpose isn't enough
-        # to be able to use the exact same code for columns and rows
-        # so the 'width' and 'height' of the blocks need to be swapped
-        if transpose:
-            w=self.block_h
-            h=self.block_w
-        else:
-            w=self.block_w
-            h=self.block_h
-
-    
-        colsum=self.cands.sum(axis=0) # Sum the candidates along the columns
-        colsumbool=np.logical_and(colsum<=h, colsum>1) # Find the sums that are less than or equal to the
-            # number of squares in the height of each block
-        cols, nums= np.where(colsumbool) # Find the columns in which it occurs and what the corresponding numbers are
-        # Find the row numbers for which squares are part of candidate groups
-        inds, rows = self.cands[:, cols, nums].T.nonzero() 
-        
-        # Loop over every instance of there being h or fewer candidates of a number in the same column
-        for i in range(len(cols)): 
-
-            # The slice of elements in rows that correspond to the squares in cols that share a candidate
-            rows_slice=rows[inds==i] 
-            rows_slice_blockn=rows_slice//h # Divided by the block height to get the "block number" in that row
-
-            # The block number of the first entry
-            row_blockn=rows_slice_blockn[0]
-            
-            # If the squares sharing candidates in the column are all in the same block:
-            if(rows_slice_blockn==row_blockn).all(): 
-
-                col=cols[i] # The current column
-                col_blockn=col//w # The column number divided by the block width to get the "block number" in that column
-
-                # Set all candidates for that value in that block equal to zero
-                self.cands[h*row_blockn:h*(row_blockn+1), w*col_blockn:w*(col_blockn+1), nums[i]]=0 
-                self.cands[rows_slice, col, nums[i]]=1 # Set the originals back to 1
-
-
-
-    def Rule_1_blocks(self):
-        # Applies Rule 1 to every block
-    
-        for block_num in np.arange(self.size):
-
-            # The block of candidates as a 9x9 grid
-            block=self.cands[self.block_nums==block_num]                
-            blocksum=block.sum(axis=0) # The number of each candidate value in the block
-            # Booleans of which candidate values are present 2-3 times in the block
-            blocksumbool=np.logical_and(blocksum<=max(self.block_w, self.block_h), blocksum>1) 
-            # The candidate values for which there are block_w or block_h or fewer candidates in that block
-            nums=np.where(blocksumbool)[0]#.squeeze() 
-            # A dummy index and the positions in the block of the squares with a candidate that is part of a pair or triple
-            inds, pos=block[:,nums].T.nonzero() 
-
-            # Loop over every instance of there being block_w or block_h or fewer candidates in that block
-            for i in range(len(nums)): 
-
-                # The slice of elements in pos that correspond to the squares in block that share a candidate
-                pos_slice=pos[inds==i] 
-                pos_slice_row=pos_slice//self.block_w # Divided by the block width to get the row number in the block
-                pos_slice_col=pos_slice%self.block_w # Mod block width to get the column number in the block
-
-                row=pos_slice_row[0] # The row number in the block of the first entry of the slice
-                if(pos_slice_row==row).all(): # If the squares sharing candidates in the block are all in the same row:
-
-                    row=row+self.block_h*(block_num//self.block_h) # The row number of the squares sharing a candidate
-                    self.cands[row, :, nums[i]]=0 # Remove the candidate from all squares in the row
-                        # Add back the ones in the block
-                    self.cands[row,pos_slice_col+self.block_w*(block_num%self.block_h), nums[i]]=1 
-
-
-                col=pos_slice_col[0] # The column number in the block of the first entry of the slice
-                if(pos_slice_col==col).all(): # If the squares sharing candidates in the block are all in the same column:
-
-                    col=col+self.block_w*(block_num%self.block_h) # The column number of the grid                
-                    self.cands[:, col, nums[i]]=0 # Remove the candidate from all squares in the column
-                        # Add back the ones in the block
-                    self.cands[pos_slice_row+self.block_h*(block_num//self.block_h), col, nums[i]]=1 
-                    
-                    
-
-                
-    def Rule_1(self):
-        # Applies Rule 1 to the entire grid
-        
-        # Apply to columns
-        self.Rule_1_columns()
-        
-        # Apply to the rows
-        self.cands=np.transpose(self.cands, [1,0,2]) # Transpose the cands array first
-        self.Rule_1_columns(transpose=True) # Apply to the new 'columns'
-        self.cands=np.transpose(self.cands, [1,0,2]) # Transpose it back
-        
-        # Apply to the blocks
-        self.Rule_1_blocks()
-            
-    
-    def Rule_2_X(self, X, group_size=2):
-        # Applies Condition 2 of Rule 2 with group_size to a single set of squares from
-        # a row, column, or block
-        # Also functions as the logic for x-wing when fed a the grid of candidates for a single number
-        
-        # Proceed only if there are as many unsolved squares in the set as twice group_size
-        if (X.sum(axis=1)>0).sum()>=(group_size*2):
-
-            squares_sum=X.sum(axis=1) # The number of candidates each square in the set has
-            squares_sum_cond=(squares_sum>1)&(squares_sum<=group_size) # The condition array with True values in the
-                # positions where the squares have up to group_size candidates
-            squares=self.inds[squares_sum_cond] # The indices of the squares which have up to group_size
-                # candidates in the set
-
-            # Proceed if the set has more than group_size squares with up to group_size candidates
-            if len(squares)>=group_size:
-
-                combs=np.array(list(it.combinations(squares, group_size))) # An array of all possible combinations
-                    # of the indices of the squares with up to group_size candidates
-
-                # Loop over every combination
-                for comb in combs:
-
-                    # Find the unique numbers for which the set of squares in comb have candidates
-                    inds, nums = np.where(X[comb]==1)
-                    unique_nums=np.unique(nums)
-
-                    # Condition 2 is met if the combination of squares only has 
-                    # candidates for group_size numbers between them
-                    if len(unique_nums)<=group_size:
-
-                        # Remove those numbers as candiates from all the other squares in the set
-                        for pos in self.inds[np.isin(self.inds, comb, invert=True)]:
-
-                            X[pos][unique_nums]=0
-                            
-        return X
-            
-        
-    def Rule_2_group_size(self, group_size=2):
-        # Applies both conditions of Rule 2 and X-wing with group_size to the whole grid
-        
-        for i in range(self.size):
-            
-            # Apply to the ith row
-            self.cands[i]=self.Rule_2_X(self.cands[i], group_size)
-            self.cands[i]=self.Rule_2_X(self.cands[i].T, group_size).T
-
-            # The ith column
-            self.cands[:,i]=self.Rule_2_X(self.cands[:,i], group_size)
-            self.cands[:,i]=self.Rule_2_X(self.cands[:,i].T, group_size).T
-            
-            # The ith block
-            block_cands=self.cands[self.block_nums==i]
-            block_cands=self.Rule_2_X(block_cands, group_size)
-            block_cands=self.Rule_2_X(block_cands.T, group_size).T
-            self.cands[self.block_nums==i]=block_cands
-            
-            # Apply to candidates of number i for x-wing
-            self.cands[:,:,i]=self.Rule_2_X(self.cands[:,:,i], group_size)
-            self.cands[:,:,i]=self.Rule_2_X(self.cands[:,:,i].T, group_size).T
-    
-    
-    def Rule_2(self):
-        # Applies Rule 2 to the whole grid, considering group_size up to size//2 as necessary
-        
-        group_size=2
-        
-        # Run the loop checking with increasing group_size until a change is made
-        # somewhere in cands
-        self.prev_cands=self.cands.copy()
-        while group_size<=self.size//2 and (self.prev_cands==self.cands).all():
-            
-            #print("  Group size: ", group_size)
-            self.Rule_2_group_size(group_size)
-            
-            group_size+=1
-            
-    
-    def Rule_3(self):
-        # Applies rule 3 to the whole grid
-        
-        # Find the row, column, and block number of the squares with exactly 2 candidates
-        cands_sum_cond=self.cands.sum(axis=2)==2 # Boolean array for which squares have two candidates
-        pairs_rows, pairs_cols = np.where(cands_sum_cond) # The row and column numbers of the squares with two candidates
-        pairs_blocks=self.block_nums[cands_sum_cond] # The block numbers for the squares with two candidates
-        pairs_cands=self.cands[cands_sum_cond] # The candidate lists for the squares with two candidates
-        pairs_cands_bool=pairs_cands==1 # Boolean candidate lists
-        inds=np.arange(len(pairs_cands)) # An array to index each occurrence of two candidates in a square
-
-        # Loop over every square with exactly two candidates
-        for i in inds:
-
-            # Find the other squares with two candidates that are in the same row, column, or block
-            # and share exactly one candidate with the current square
-
-            # Indentify the row, column, and block number of the current square
-            c=pairs_cands[i] # The candidate list of the current square
-            c_bool=pairs_cands_bool[i] # The boolean candidate list of the current square
-            row=pairs_rows[i] # The row number of the current square
-            col=pairs_cols[i] # The column number
-            block_num=pairs_blocks[i] # The block number
-
-            # Indices in the list of two-candidate squares that:
-            # - share exactly one candidate with the current square
-            # - intersect the current square
-            shares_ints_inds=inds[((c_bool&(c==pairs_cands)).sum(axis=1)==1)&\
-                                  ((pairs_rows==row)|(pairs_cols==col)|(pairs_blocks==block_num))]
-
-            
-            # Check to see if two of them also share a candidate but don't intersect with the
-            # current square in the same way
-
-            # The combinations of pairs of squares meeting the above criteria
-            combs=np.array(list(it.combinations(shares_ints_inds, 2)))
-
-            # Check every pair combination
-            for comb in combs:
-
-                i1=comb[0]
-                i2=comb[1]
-
-                # Boolean for whether the two squares intersect each other
-                intersect_eachother=pairs_rows[i1]==pairs_rows[i2] or\
-                                    pairs_cols[i1]==pairs_cols[i2] or\
-                                    pairs_blocks[i1]==pairs_blocks[i2]
-
-                # Check whether the two squares share a candidate that is not in the original square
-
-                # Boolean list for the numbers for which the two sqaures in comb share a candidate
-                shared_cands_bool=pairs_cands_bool[i1]&(pairs_cands[i1]==pairs_cands[i2])
-
-                # If the two squares:
-                # - do not intersect
-                # - share exactly one candidate
-                # - do not share a candidate that is also in the current square
-                # we have y-wing
-                if not intersect_eachother and shared_cands_bool.sum()==1 and not (shared_cands_bool&c_bool).any():
-
-                    # Eliminate the candidate from squares intersecting both secondary squares
-
-                    num=self.inds[shared_cands_bool] # The number to be eliminated as a candidate
-                    
-                    # Eliminate the number as a candidate based on row and column intersections
-                    self.cands[pairs_rows[i1], pairs_cols[i2], num]=0
-                    self.cands[pairs_rows[i2], pairs_cols[i1], num]=0
-
-                    # Eliminate the number as a candidate based on block intersections
-                    # Boolean array indicating the squares that are in the same block as one of the two y-wing squares
-                    # and in the same row or column as the other
-                    block_intersect_bool=((self.block_nums==pairs_blocks[i1])&\
-                                            ((self.row_nums==pairs_rows[i2])|(self.col_nums==pairs_cols[i2])))|\
-                                         ((self.block_nums==pairs_blocks[i2])&\
-                                            ((self.row_nums==pairs_rows[i1])|(self.col_nums==pairs_cols[i1])))
-
-                    # The list of rows and columns where block_intersect_bool is True
-                    rs, cs = np.where(block_intersect_bool)
-                    self.cands[rs, cs, num]=0 # Eliminate the number as a candidate in those squares
-    
-    
-    def Rule_4(self):
-        # Applies Rule 4 
-            
-        # The first time we have to start guessing, permanently record the current state of 
-        # cands and grid and establish the list of squares to use for geussing
-        if self.rule_4_count==0:
-            self.current_cands=self.cands.copy()
-            self.current_grid=self.grid.copy()
-
-            # Find the row and column numbers of the squares with exactly 2 candidates
-            cands_sum_cond=self.cands.sum(axis=2)==2 # Boolean array for which squares have two candidates
-            # The row and column numbers of the squares with two candidates
-            self.pairs_rows, self.pairs_cols = np.where(cands_sum_cond) 
-            
-        # If we have checked both candidates in every two-candidate square
-        # we couldn't solve the puzzle, so break out of the solve loop
-        # by not changing any candidates
-        if self.rule_4_count>=2*len(self.pairs_rows):
-            return None
-
-        # Reset cands and grid to the state they were in before
-        # we started guessing
-        self.cands=self.current_cands.copy()
-        self.grid=self.current_grid.copy()
-
-        # If Rule 4 has been called an even number of times, it is time to move on
-        # to the next square with two candidates
-        if self.rule_4_count%2==0:
-
-            guess_ind=self.rule_4_count//2
-
-            # Establish the coordinates of the guess we are making
-            self.guess_row=self.pairs_rows[guess_ind]
-            self.guess_col=self.pairs_cols[guess_ind]
-            self.guess_nums=self.inds[self.cands[self.guess_row, self.guess_col]==1]
-            guess_num=self.guess_nums[0]
-
-
-        # If Rule 4 has been called an odd number of times, it is time
-        # to check the second candidate of the current square
-        else:
-            guess_num=self.guess_nums[1]
-
-
-        # Eliminate the chosen candidate
-        self.cands[self.guess_row, self.guess_col, guess_num]=0
-
-        # Update the number of time Rule 4 has been called
-        self.rule_4_count+=1
-        
-
-    
-    def is_solved(self):
-        # Checks if the grid is solved and updates and returns the solved state as a boolean value
-        
-        # Do a quick check by checking if there are any blank spots still in the grid
-        self.solved=(self.grid!=0).all()
-        
-        # If no blank spots remain, do a more thorough check to make sure there is 
-        # exactly one of every number in each row, column, and block
-        if self.solved:
-            for i in range(self.size):
-
-                nums, counts_blocks = np.unique(self.grid[self.block_nums==i], return_counts=True)
-                nums, counts_rows=np.unique(self.grid[i], return_counts=True)
-                nums, counts_cols=np.unique(self.grid[:,i], return_counts=True)
-
-                self.solved=self.solved and (counts_rows==1).all() and (counts_cols==1).all() and (counts_blocks==1).all()
-        
-        return self.solved
-    
-    
-    def solve_step(self):
-        # Based on the current list of candidates, try to fill in any squares with only one
-        # candidate or where a square has the only candidate for that value in its
-        # row, column, or block
-
-        # Fill in spots with only once candidate
-        locs=np.sum(self.cands, axis=2)==1
-        self.grid[locs]=np.where(self.cands[locs]==1)[1]+1
-
-        # Fill in spots where a candidate is the only one of its value in its row, column, or block
-        # Sum all the candidate vectors in a given row, and any position with a value of 1 indicates
-        # the value for which there is only one square with that potential candidate
-
-        # Columns
-        cols, nums = np.where(np.sum(self.cands, axis=0)==1)
-        inds, rows = self.cands[:, cols, nums].T.nonzero()
-        self.grid[rows, cols]=nums+1
-
-        # Rows
-        rows, nums = np.where(np.sum(self.cands, axis=1)==1)
-        inds, cols = self.cands[rows, :, nums].nonzero()
-        self.grid[rows, cols]=nums+1
-
-        # Blocks
-        for block_num in np.arange(self.size):
-
-            block=self.cands[self.block_nums==block_num]
-                
-            nums=np.where(block.sum(axis=0)==1)[0].squeeze()
-            inds=block[:,nums].T.nonzero()[-1].squeeze()
-                        
-            self.grid[self.block_nums==block_num][inds]=nums+1
-
-                
-                
-    def solve_loop(self):
-        # Iterates the solving procedure until the puzzle is solved or deemed unsolvable
-            
-        self.prev_cands=self.cands.copy() # Update the previous state of cands
-
-        # Try eliminating candidates using all the rules until a change is made to cands
-        # or it runs out of rules
-        rule=0
-        while (self.cands==self.prev_cands).all() and rule<len(self.rule_func_list):
-
-            # Apply the current rule
-            # print("Rule %d"%rule)
-            self.rule_func_list[rule]()
-            self.max_rule=max(rule, self.max_rule)
-            rule+=1
-
-        # If a change was made by the Rules
-        if (self.prev_cands!=self.cands).any():
-
-            self.solve_step() # Fill in values according to the current state of cands
-            self.num_steps+=1
-
-            # If that solved the puzzle
-            if self.is_solved():
-                #print("Solved in %d steps."%self.num_steps)
-                #print("The highest rule used was Rule %d."%self.max_rule)
-                None
-                
-            # If not
-            else:
-                # Start back at the top of the function
-                self.solve_loop()
-        
-        # If no change was made by the Rules, then it is not solved
-        # and there is nothing more to do
-        else:
-            # Revert cands and grid to the state before the program started guessing
-            self.cands=self.current_cands
-            self.grid=self.current_grid
-            #print("I couldn't solve it.")
-            
-            
-def main():
-
-    grid=np.array([[1,7,0,0,0,2,0,9,5],
-                   [4,0,0,0,0,0,0,0,0],
-                   [0,0,0,0,8,0,0,2,0],
-                   [2,5,0,0,0,8,0,0,1],
-                   [0,0,0,3,0,0,6,0,0],
-                   [0,0,9,0,0,0,0,0,0],
-                   [7,9,0,0,6,0,1,0,0],
-                   [0,0,8,0,0,0,0,0,9],
-                   [0,0,4,0,0,7,0,0,0]])
-    
-    puzzle=Sudoku_Puzzle(grid)
-    print("The puzzle: ")
-    print(puzzle.grid)
-    puzzle.solve_loop()
-    print(puzzle.grid)
-    
-    
-if __name__=="__main__":
-
-    main()
-    
+import argparse
+import collections
+import concurrent.futures
+import functools
+import itertools as it
+import math
+import os
+import sys
+import time
+import numpy as np
+from Sudoku_Quick import parse_line, format_line
+from Sudoku_Store import Sudoku_Store
+
+
+# Candidates are stored as one integer per square with bit n-1 set if the number n
+# is still a candidate for that square. These functions work on whole arrays of them.
+
+# The number of set bits in every byte value, used when numpy has no bitwise_count
+POPCOUNT_TABLE=np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def cand_dtype(size):
+    # The integer type used to hold the candidate bits of a puzzle of the given size.
+    # Anything bigger than 64 numbers falls back to Python integers.
+
+    if size<=16:
+        return np.uint16
+    if size<=64:
+        return np.uint64
+    return object
+
+
+def popcount(bits):
+    # Counts the candidates (set bits) in every element of bits
+
+    bits=np.asarray(bits)
+    if bits.dtype==object:
+        return np.frompyfunc(int.bit_count, 1, 1)(bits).astype(int)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(bits)
+
+    # Older numpy: look up the count of every byte and add them up
+    bits=np.ascontiguousarray(bits)
+    return POPCOUNT_TABLE[bits.view(np.uint8)].reshape(bits.shape+(bits.itemsize,)).sum(axis=-1)
+
+
+def lowest_bit(bits):
+    # Isolates the lowest set bit of every element of bits
+
+    bits=np.asarray(bits)
+    return bits&(~bits+1)
+
+
+def bit_index(bits):
+    # The position of the highest set bit of every element of bits, or -1 where it is zero.
+    # Used on single bits (e.g. from lowest_bit) to get the number they stand for minus one.
+
+    bits=np.asarray(bits)
+    if bits.dtype==object:
+        return np.frompyfunc(int.bit_length, 1, 1)(bits).astype(int)-1
+    # frexp gives the exponent exactly, even for bits too big to be exact in a float
+    return np.frexp(bits.astype(float))[1]-1
+
+
+
+def algorithm_x(X, Y, max_nodes=None, deadline=None):
+    # Knuth's Algorithm X for exact cover, with dictionaries of sets standing in for the dancing links.
+    # X maps every constraint to the set of choices that cover it, Y maps every choice to the
+    # constraints it covers. Yields every list of choices that covers each constraint exactly once.
+    # With max_nodes, it gives up after taking that many choices and yields None as its last
+    # value, so that giving up can be told apart from running out of solutions. With deadline,
+    # a time.perf_counter() value, it gives up the same way once that time has passed.
+    # X is changed along the way but is back the way it was at the end, or when the generator is
+    # closed early (like after taking only the first solution).
+    # Uses its own stack instead of recursing, so it works however many choices a solution needs.
+
+    def select(r):
+        # Takes choice r: removes its constraints and every other choice that clashes with it.
+        # Notes down the constraints left with one choice or none, so they can be covered
+        # next without looking through all of X.
+        cols=[]
+        for j in Y[r]:
+            for i in X[j]:
+                for k in Y[i]:
+                    if k!=j:
+                        choices=X[k]
+                        choices.remove(i)
+                        if len(choices)<=1:
+                            forced.append(k)
+            cols.append(X.pop(j))
+        return cols
+
+    def deselect(r, cols):
+        # Puts back everything select(r) removed
+        for j in reversed(Y[r]):
+            X[j]=cols.pop()
+            for i in X[j]:
+                for k in Y[i]:
+                    if k!=j:
+                        X[k].add(i)
+
+    solution=[]
+    # One entry for every choice in solution: [choices left to try instead, what select removed]
+    stack=[]
+    forced=[]
+    nodes=0
+    try:
+        while True:
+            if not X:
+                yield list(solution)
+            else:
+                # Cover the constraint with the fewest choices next, taking one that select noted
+                # down if it still has a single choice or none, or else stopping early at one
+                c, fewest = None, None
+                while forced:
+                    j=forced.pop()
+                    if j in X and len(X[j])<=1:
+                        c=j
+                        break
+                else:
+                    for j, choices in X.items():
+                        if c is None or len(choices)<fewest:
+                            c, fewest = j, len(choices)
+                            if fewest<=1:
+                                break
+                stack.append([sorted(X[c], reverse=True), None])
+
+            # Move on to the next choice, going back as far as needed
+            while stack:
+                frame=stack[-1]
+                if frame[1] is not None:
+                    deselect(solution.pop(), frame[1])
+                    frame[1]=None
+                if frame[0]:
+                    nodes+=1
+                    if (max_nodes is not None and nodes>max_nodes) or\
+                       (deadline is not None and time.perf_counter()>=deadline):
+                        yield None
+                        return
+                    r=frame[0].pop()
+                    solution.append(r)
+                    frame[1]=select(r)
+                    break
+                stack.pop()
+            else:
+                return
+    finally:
+        # Closed before the end: put back what the choices still in solution removed
+        while stack:
+            frame=stack.pop()
+            if frame[1] is not None:
+                deselect(solution.pop(), frame[1])
+
+
+def take_choice(X, Y, r):
+    # Takes choice r for good, outside of algorithm_x: removes its constraints from X
+    # and every choice that clashes with it. Returns False and changes nothing if one of
+    # its constraints is already covered.
+
+    if any(j not in X for j in Y[r]):
+        return False
+    for j in Y[r]:
+        for i in X[j]:
+            for k in Y[i]:
+                if k!=j:
+                    X[k].discard(i)
+        del X[j]
+    return True
+
+
+class Sudoku_Geometry:
+# The layout of the rows, columns, and blocks of a puzzle with a given size and block width.
+# None of it depends on the numbers in the puzzle, so it is built once for each
+# (size, block_w) by get_geometry() and shared by every Sudoku_Puzzle of that shape.
+
+    def __init__(self, size, block_w):
+
+        self.size=size
+        self.block_w=block_w
+        self.block_h=size//block_w
+        self.inds=np.arange(size)
+
+        # Grids with elements containing the row, column, or block number for each square
+        self.row_nums, self.col_nums = np.indices((size, size))
+        self.block_nums=self.block_h*(self.row_nums//self.block_h)+self.col_nums//self.block_w
+
+        # The row and column indices of the squares in every block, in reading order.
+        # Block i starts in row block_h*(i//block_h) and column block_w*(i%block_h).
+        in_rows, in_cols = np.divmod(self.inds, self.block_w)
+        self.block_rows=self.block_h*(self.inds[:,None]//self.block_h)+in_rows[None,:]
+        self.block_cols=self.block_w*(self.inds[:,None]%self.block_h)+in_cols[None,:]
+
+        # Every set as a row of squares: the rows, then the columns, then the blocks.
+        # unit_rows[u], unit_cols[u] index the squares of set u.
+        self.unit_rows=np.concatenate([self.row_nums, self.row_nums.T, self.block_rows])
+        self.unit_cols=np.concatenate([self.col_nums, self.col_nums.T, self.block_cols])
+
+        # The three sets each square belongs to
+        self.square_units=np.stack([self.row_nums, size+self.col_nums, 2*size+self.block_nums], axis=-1)
+
+        # The peers of every square (the other squares sharing a row, column, or block with it)
+        # as flat indices into the grid, one row of the array per square
+        rows, cols = self.row_nums.ravel(), self.col_nums.ravel()
+        others=(self.inds[:,None]+1+self.inds[None,:-1])%size # The other size-1 indices after each index
+        row_peers=rows[:,None]*size+others[cols] # Same row, other columns
+        col_peers=others[rows]*size+cols[:,None] # Same column, other rows
+        # The rest of the block, leaving out the squares already in the row or column
+        blocks=self.block_nums.ravel()
+        in_block=(self.block_rows[blocks]!=rows[:,None])&(self.block_cols[blocks]!=cols[:,None])
+        block_peers=(self.block_rows[blocks]*size+self.block_cols[blocks])[in_block].reshape(size*size, -1)
+        self.peers=np.sort(np.concatenate([row_peers, col_peers, block_peers], axis=1), axis=1)
+        self.peer_rows, self.peer_cols = np.divmod(self.peers, size)
+
+        # The candidate bits, which only depend on the size
+        self.dtype=cand_dtype(size)
+        # bit_table[n-1] is the bit standing for the number n
+        self.bit_table=np.array([1<<n for n in range(size)], dtype=self.dtype)
+        self.full_bits=self.bit_table.sum(dtype=self.dtype) # Every number is a candidate
+
+        # The exact cover version of the puzzle. Putting number n+1 in square (row, col) is
+        # choice (row*size+col)*size+n, and it covers four constraints: that square is filled,
+        # and n+1 is in that row, that column, and that block. cover_cols[choice] are their indices.
+        rows, cols, nums = np.indices((size, size, size)).reshape(3, -1)
+        blocks=self.block_nums[rows, cols]
+        self.cover_cols=np.stack([rows*size+cols, (size+rows)*size+nums, (2*size+cols)*size+nums,\
+                                  (3*size+blocks)*size+nums], axis=1)
+
+        # These are shared between puzzles, so make sure nobody writes into them by accident
+        for array in [self.row_nums, self.col_nums, self.block_nums, self.block_rows, self.block_cols,
+                      self.unit_rows, self.unit_cols, self.square_units, self.peers, self.peer_rows,
+                      self.peer_cols, self.bit_table, self.cover_cols]:
+            array.setflags(write=False)
+
+
+    def block_view(self, a):
+        # Reshapes an array with the grid as its first two axes so that the blocks can be
+        # reached by position: a[band, row in block, stack, column in block, ...]
+
+        return a.reshape((self.size//self.block_h, self.block_h, self.size//self.block_w, self.block_w)+a.shape[2:])
+
+
+    def units(self, a):
+        # Gathers an array with the grid as its first two axes into every set:
+        # the result has shape (3*size, size, ...) in the order of unit_rows and unit_cols
+
+        return a[self.unit_rows, self.unit_cols]
+
+
+    def line_claims(self, view, rows=False, lines=None):
+        # The line part of Rule 1, on booleans of the candidates as given by block_view, with any number
+        # of extra axes in front: [..., band, row in block, stack, column in block, number].
+        # Finds the numbers with 2 to block_h candidates in a column (or 2 to block_w in a row with rows)
+        # that are all in the same block, only in the lines that are True in lines if it's given.
+        # Returns booleans of the same shape as view of the candidates that can be eliminated:
+        # that number in the rest of the block.
+
+        if rows:
+            counts=view.sum(axis=-2) # [..., band, row, stack, number]
+            total=counts.sum(axis=-2, keepdims=True)
+            claims=(counts==total)&(total>1)&(total<=self.block_w)
+            if lines is not None:
+                claims&=lines.reshape(self.block_w, self.block_h)[:,:,None,None]
+            # Every claim removes its number from the other rows of its block
+            others=claims.sum(axis=-3, keepdims=True)-claims
+            remove=np.expand_dims(others>0, -2)
+        else:
+            counts=view.sum(axis=-4) # [..., band, stack, column, number]
+            total=counts.sum(axis=-4, keepdims=True)
+            claims=(counts==total)&(total>1)&(total<=self.block_h)
+            if lines is not None:
+                claims&=lines.reshape(self.block_h, self.block_w)[:,:,None]
+            others=claims.sum(axis=-2, keepdims=True)-claims
+            remove=np.expand_dims(others>0, -4)
+        return np.broadcast_to(remove, view.shape)
+
+
+    def block_pointing(self, view, blocks=None):
+        # The block part of Rule 1, on booleans of the candidates from block_view like line_claims.
+        # Finds the numbers with more than one candidate in a block, all in the same row of the block
+        # (so at most block_w of them) or all in the same column (at most block_h), only in the blocks
+        # that are True in blocks, a [..., band, stack] array, if it's given.
+        # Returns booleans of the candidates that can be eliminated: that number in the rest of the row
+        # or column outside the block.
+
+        count=view.sum(axis=(-4,-2)) # [..., band, stack, number]
+        several=count>1
+        if blocks is not None:
+            several&=blocks[...,None]
+
+        in_rows=view.any(axis=-2) # [..., band, row, stack, number]
+        row_claims=in_rows&(in_rows.sum(axis=-3, keepdims=True)==1)&np.expand_dims(several, -3)
+        others=row_claims.sum(axis=-2, keepdims=True)-row_claims # From the other blocks in the band
+        remove=np.expand_dims(others>0, -2)
+
+        in_cols=view.any(axis=-4) # [..., band, stack, column, number]
+        col_claims=in_cols&(in_cols.sum(axis=-2, keepdims=True)==1)&np.expand_dims(several, -2)
+        others=col_claims.sum(axis=-4, keepdims=True)-col_claims # From the other blocks in the stack
+        return remove|np.expand_dims(others>0, -4)
+
+
+    def block_waves(self):
+        # Booleans of the blocks, [band, stack], in groups that can have block_pointing done all at once
+        # and still give the same result as doing the blocks one at a time in order, each seeing what the
+        # ones before it eliminated. A block only eliminates from the blocks in its band and stack, so the
+        # blocks with the same band+stack don't touch each other, and the blocks before them in the same
+        # band or stack all have a smaller band+stack.
+
+        bands, stacks = self.size//self.block_h, self.size//self.block_w
+        wave=np.add.outer(np.arange(bands), np.arange(stacks))
+        return [wave==i for i in range(bands+stacks-1)]
+
+
+@functools.lru_cache(maxsize=None)
+def get_geometry(size, block_w):
+    # The shared Sudoku_Geometry for puzzles of this size and block width
+
+    return Sudoku_Geometry(size, block_w)
+
+
+class Solve_Interrupted(Exception):
+# Raised by Sudoku_Puzzle.check_limits when a solve runs out of time, steps, or guesses,
+# or gets cancelled. status is 'budget_exhausted' or 'cancelled'. solve_loop catches it,
+# so it only gets out of the rules or search when they are called directly.
+
+    def __init__(self, status, message):
+
+        super().__init__(message)
+        self.status=status
+
+
+# The rule number of the deltas in a Sudoku_Trace that come from solve_step
+SOLVE_STEP=-1
+
+
+class Sudoku_Trace:
+# A record of how solve_loop solved a puzzle, kept when it's given trace=True, to explain a grade or show
+# the solution step by step without keeping a copy of the candidates for every step. Every rule that
+# eliminated something and every solve_step that filled something in is one delta: the rule (SOLVE_STEP for
+# solve_step), the step it was in, the candidates it eliminated as (row, col, number), and the squares it
+# filled in as (row, col, number), each sorted by square and number. What Rule 5 did while guessing isn't
+# kept, only what it left behind.
+# While solving, the changes are just put on a list as they come; get_arrays() turns them into flat
+# arrays when they're needed, which is what save() writes to a .npz and replay() works from.
+
+    def __init__(self, grid, cand_bits, block_w):
+        # grid and cand_bits are the puzzle before the first delta, and shouldn't be changed after
+
+        self.grid=grid
+        self.cand_bits=cand_bits
+        self.block_w=block_w
+        self.size=len(self.grid)
+        self.geom=get_geometry(self.size, block_w)
+        self.rule=0 # The rule being applied right now, set by Sudoku_Puzzle.step
+        # The changes as (step, rule, fill, rows, cols, values), where values are the numbers filled in
+        # for fills and the candidates removed as bits for eliminations. Any of them can be arrays.
+        self.changes=[]
+        self.batch=None # (changes of the whole batch, number of the puzzle in it) for a trace from a Sudoku_Batch
+        self.arrays=None # What get_arrays() made the last time, until something else is recorded
+
+
+    def record(self, step, fill, rows, cols, values, rule=None):
+        # Adds the squares filled in (with fill) or the candidates eliminated by rule,
+        # or by the rule being applied if it isn't given
+
+        self.changes.append((step, self.rule if rule is None else rule, fill, rows, cols, values))
+        self.arrays=None
+
+
+    def extend(self, trace):
+        # Adds the deltas of a trace that started where this one left off
+
+        self.changes.extend(trace.get_changes())
+        self.arrays=None
+
+
+    def get_changes(self):
+        # The changes recorded, first putting this puzzle's part of the changes of its Sudoku_Batch
+        # in front if it came from one. The first trace of the batch to get here splits them up for all of them.
+
+        if self.batch is not None:
+            batch, i = self.batch
+            if batch['split'] is None:
+                batch['split']=split_changes(batch['changes'], batch['size'], batch['count'])
+            self.changes[:0]=batch['split'][i]
+            batch['split'][i]=None
+            self.batch=None
+        return self.changes
+
+
+    def get_arrays(self):
+        # The trace as a dictionary of arrays: the starting grid and cand_bits, block_w, then
+        # rule and step with one entry per delta, elim and fill with a (row, col, number) row for every
+        # candidate eliminated and square filled in, and elim_start and fill_start, where the rows
+        # of delta k are elim[elim_start[k]:elim_start[k+1]] and fill[fill_start[k]:fill_start[k+1]].
+
+        if self.arrays is not None:
+            return self.arrays
+
+        changes=self.get_changes()
+        lengths=[len(np.atleast_1d(change[3])) for change in changes]
+        def flat(k, dtype):
+            return np.concatenate([np.broadcast_to(change[k], (length,)).astype(dtype)\
+                                   for change, length in zip(changes, lengths)]+[np.zeros(0, dtype)])
+        step, rule, fill = flat(0, int), flat(1, int), flat(2, bool)
+        rows, cols, values = flat(3, int), flat(4, int), flat(5, self.geom.dtype)
+
+        # A new delta starts wherever the step or the rule changes
+        new=np.ones(len(step), dtype=bool)
+        new[1:]=(step[1:]!=step[:-1])|(rule[1:]!=rule[:-1])
+        delta=np.cumsum(new)-1
+        count=int(new.sum())
+
+        # One row for every number in the bits eliminated
+        elim=~fill
+        k, nums = np.nonzero((values[elim,None]&self.geom.bit_table)!=0)
+        elim_rows, elim_delta = self.sort_rows(delta[elim][k], rows[elim][k], cols[elim][k], nums+1)
+        fill_rows, fill_delta = self.sort_rows(delta[fill], rows[fill], cols[fill], values[fill].astype(int))
+
+        self.arrays={'grid': self.grid, 'cand_bits': self.cand_bits, 'block_w': np.array(self.block_w),
+                     'rule': rule[new], 'step': step[new],
+                     'elim': elim_rows, 'elim_start': np.searchsorted(elim_delta, np.arange(count+1)),
+                     'fill': fill_rows, 'fill_start': np.searchsorted(fill_delta, np.arange(count+1))}
+        return self.arrays
+
+
+    def sort_rows(self, delta, rows, cols, nums):
+        # The (row, col, number) rows of the deltas, sorted within each delta and with each one only once,
+        # along with the delta of every row. The rules and Sudoku_Batch record changes in different orders
+        # and the rules can record one twice, so this is what makes their traces come out the same.
+
+        base=self.size+1
+        key=np.unique(((delta.astype(np.int64)*base+rows)*base+cols)*base+nums)
+        key, nums = np.divmod(key, base)
+        key, cols = np.divmod(key, base)
+        delta, rows = np.divmod(key, base)
+        return np.column_stack([rows, cols, nums]).reshape(-1, 3), delta
+
+
+    def __len__(self):
+        # The number of deltas
+
+        return len(self.get_arrays()['rule'])
+
+
+    def delta(self, k):
+        # Delta k as a dictionary of its rule, step, and (row, col, number) arrays elim and fill
+
+        arrays=self.get_arrays()
+        return {'rule': int(arrays['rule'][k]), 'step': int(arrays['step'][k]),
+                'elim': arrays['elim'][arrays['elim_start'][k]:arrays['elim_start'][k+1]],
+                'fill': arrays['fill'][arrays['fill_start'][k]:arrays['fill_start'][k+1]]}
+
+
+    def replay(self, count=None, step=None):
+        # The grid and cand_bits after the first count deltas, or after everything done before
+        # step (so step=0 is the start), or after all of them if neither is given
+
+        arrays=self.get_arrays()
+        if step is not None:
+            count=np.searchsorted(arrays['step'], step)
+        elif count is None:
+            count=len(arrays['rule'])
+
+        grid=self.grid.copy()
+        cand_bits=self.cand_bits.copy()
+        elim=arrays['elim'][:arrays['elim_start'][count]]
+        np.bitwise_and.at(cand_bits, (elim[:,0], elim[:,1]), ~self.geom.bit_table[elim[:,2]-1])
+        fill=arrays['fill'][:arrays['fill_start'][count]]
+        grid[fill[:,0], fill[:,1]]=fill[:,2]
+        return grid, cand_bits
+
+
+    def save(self, path):
+        # Writes the arrays from get_arrays() to a compressed .npz file, read back by load_trace
+
+        np.savez_compressed(path, **self.get_arrays())
+
+
+def load_trace(path):
+    # Reads a Sudoku_Trace written by save(). It can be replayed, but nothing can be added to it.
+
+    with np.load(path) as data:
+        trace=Sudoku_Trace(data['grid'], data['cand_bits'], int(data['block_w']))
+        trace.arrays={name: data[name] for name in data.files}
+    return trace
+
+
+class Sudoku_Puzzle:
+# Define the Sudoku Puzzle object with all the variables and functions
+# used to solve the puzzle
+   
+    def __init__(self, grid=np.zeros((9,9)), block_w=3, incremental=True, method='rules', stats=False):
+        # Check and initialize parameters and variables used in the solving process.
+        # The grid containing the puzzle values and the number of squares in the
+        # width of each block should be given when the object is created.
+        # With incremental=False, every rule looks at every set every time like it used to.
+        # method picks how solve() solves the puzzle (see solve).
+        # With stats=True, step() keeps track of what every rule did (see get_stats).
+        
+        self.grid=np.array(grid).astype(int) # The 2x2 array containing the starting values from the puzzle
+        self.size=self.grid.shape[0] # The side length of the grid and the number of numbers
+        self.block_w=block_w
+        
+       
+        # Only the width needs to be entered because the dimensions of the blocks
+        # are constrained such that the product is the grid size.
+        # Initialize the block height.
+        self.block_h=self.size//self.block_w
+        
+        # The layout of the sets, shared with every other puzzle of the same shape
+        self.geom=get_geometry(self.size, self.block_w)
+        self.inds=self.geom.inds # A list of nummbers up to self.size. Commonly used.            
+            
+        # Grids with elements containg the row, column, or block number for each square.
+        # Used for slicing out a row or block from cand_bits or with just the row/block number.
+        self.row_nums=self.geom.row_nums
+        self.col_nums=self.geom.col_nums
+        self.block_nums=self.geom.block_nums
+            
+            
+        # Initialize candidates as one bitmask per square
+        self.dtype=self.geom.dtype
+        self.bit_table=self.geom.bit_table # bit_table[n-1] is the bit standing for the number n
+        self.full_bits=self.geom.full_bits # Every number is a candidate
+        self.cand_bits=np.full((self.size, self.size), self.full_bits, dtype=self.dtype)
+
+        # Keep track of the changes made to cand_bits so that the rules only need to look at
+        # the sets and numbers that have changed since they last looked at them
+        self.incremental=incremental
+        self.change_count=0 # The number of candidates eliminated so far
+        self.clock=0 # Goes up by one every time eliminate removes something
+        self.square_stamp=np.zeros((self.size, self.size), dtype=int) # The clock when each square last changed
+        self.num_stamp=np.zeros(self.size, dtype=int) # The clock when each number was last eliminated anywhere
+        # The clock when the rules last looked at each set (and each number for x-wing),
+        # in the order rows, columns, blocks, numbers
+        self.rule_1_seen=np.full(3*self.size, -1)
+        self.rule_2_seen={} # One array for each group_size
+        self.rule_3_seen=-1
+        self.rule_4_seen=-1
+        self.rule_0_full=True # Whether Rule 0 needs to look at the whole grid
+        self.new_fills=[] # The squares solve_step has filled in since Rule 0 last ran
+
+        # How many times each number is filled in in every row, column, and block:
+        # unit_counts[u, n-1] for set u in the order of unit_rows. Kept up to date by fill() and undo().
+        # Anything that changes grid some other way has to call mark_all_changed() after.
+        self.count_units()
+
+        # Limits for Rule 4, which gets slow with a lot of candidates. It isn't tried with more than
+        # chain_max_nodes candidates left, and only follows chain_length strong links (None for no limit).
+        self.chain_max_nodes=3000
+        self.chain_length=None
+
+        # Initialize variables for Rule 5
+        self.rule_5_count=0 # The number of times Rule 5 has been called
+        self.current_bits=self.cand_bits.copy() # The state of cand_bits before Rule 5 was called the first time
+        self.current_grid=self.grid.copy() # The state of grid before Rule 5 was called the first time
+        self.search_rule=0 # The highest rule used to follow up on every guess
+        self.search_nodes=0 # The number of guesses made
+        self.search_backtracks=0 # The number of guesses that turned out to be wrong
+        # While guessing, every change to cand_bits and grid is recorded here as (array, rows, cols, old values)
+        # so that it can be undone. None when not guessing.
+        self.trail=None
+        
+        # Initialize a counter for the number of solve steps taken to solve the puzzle 
+        self.num_steps=0
+        # Keep track of the highest level Rule needed to solve the puzzle
+        self.max_rule=0        
+        # Initialize the state of being solved
+        self.solved=False
+        self.method=method # 'rules' or 'exact_cover'
+        
+        # Create a list of the Rule functions
+        self.rule_func_list=[self.Rule_0, 
+                             self.Rule_1,
+                             self.Rule_2,
+                             self.Rule_3,
+                             self.Rule_4,
+                             self.Rule_5]
+
+        # What step() has done so far, if asked for, with one entry in 'rules' for every rule:
+        # the number of calls, the seconds spent, the candidates eliminated, and the calls that didn't change anything
+        self.stats=None
+        if stats:
+            self.stats={'rules': [{'calls': 0, 'time': 0.0, 'eliminated': 0, 'no_ops': 0}\
+                                  for rule in self.rule_func_list],
+                        'fills': 0}
+        self.max_group_size=0 # The biggest group_size Rule 2 has had to look for
+        # The most combinations of squares Rule_2_X may try in one set, to keep Rule 2 from taking
+        # forever on big puzzles. None for no limit, which is the only way it's sure to find every group.
+        self.rule_2_max_nodes=None
+
+        # Functions to call when step() starts and finishes a rule, as on_rule_start(puzzle, rule) and
+        # on_rule_end(puzzle, rule, eliminated, seconds), and whenever squares are filled in, as
+        # on_fill(puzzle, rows, cols, nums). rule is the index in rule_func_list.
+        self.on_rule_start=None
+        self.on_rule_end=None
+        self.on_fill=None
+
+        # The limits solve_loop was given, checked by check_limits between rules and in the long loops.
+        # deadline is a time.perf_counter() value and cancel anything with an is_set() method,
+        # like a threading.Event. None for no limit.
+        self.deadline=None
+        self.max_steps=None
+        self.max_guesses=None
+        self.cancel=None
+        self.status=None # How the last solve_loop or solve_exact_cover ended (see solve_loop)
+
+        # The Sudoku_Trace of the last solve_loop given trace=True, and the one being recorded while it runs
+        self.trace=None
+        self.tracing=None
+                
+    
+    @property
+    def cands(self):
+        # The candidates as a size x size x size array of 1s and 0s, the way they
+        # were stored before cand_bits. Built on demand, so it is only for looking at.
+
+        return self.cand_cube().astype(float)
+
+
+    @cands.setter
+    def cands(self, cands):
+        # Packs a size x size x size array of 1s and 0s into cand_bits
+
+        self.cand_bits=self.pack_bits(np.asarray(cands)!=0)
+        self.mark_all_changed()
+
+
+    def unpack_bits(self, bits):
+        # Expands an array of bitmasks into an array of booleans with an extra last axis
+        # of length size, True where the corresponding number is a candidate
+
+        return (np.asarray(bits)[...,None]&self.bit_table)!=0
+
+
+    def pack_bits(self, bools):
+        # The inverse of unpack_bits: packs the last axis of a boolean array into bitmasks
+
+        return np.dot(bools, self.bit_table).astype(self.dtype, copy=False)
+
+
+    def cand_cube(self):
+        # A temporary boolean size x size x size view of the candidates for the rules
+        # that need to count the candidates of each number
+
+        return self.unpack_bits(self.cand_bits)
+
+
+    def transpose_bits(self, X):
+        # Treats a list of size bitmasks as a size x size grid of bits and transposes it.
+        # Turns the candidate lists of a set of squares into the lists of squares in the set
+        # with each number as a candidate, and back again.
+
+        return self.pack_bits(self.unpack_bits(X).T)
+
+
+    def eliminate(self, rows, cols, bits):
+        # Removes the candidates in bits from the squares at rows, cols and records what changed.
+        # Every rule removes candidates through here. Returns the number of candidates removed.
+
+        rows, cols, bits = np.broadcast_arrays(rows, cols, np.asarray(bits, dtype=self.dtype))
+
+        # Only keep the squares that actually lose a candidate
+        hit=(self.cand_bits[rows, cols]&bits)!=0
+        if not hit.any():
+            return 0
+        rows, cols, bits = rows[hit], cols[hit], bits[hit]
+
+        old=self.cand_bits[rows, cols]
+        if self.trail is not None:
+            self.trail.append((self.cand_bits, rows, cols, old))
+        elif self.tracing is not None:
+            self.tracing.record(self.num_steps, False, rows, cols, old&bits)
+        # ufunc.at so that repeated squares have all of their candidates removed
+        np.bitwise_and.at(self.cand_bits, (rows, cols), ~bits)
+
+        # Count the candidates removed, only counting each square once
+        first=np.unique(rows*self.size+cols, return_index=True)[1]
+        count=int(popcount(old[first]).sum())-int(popcount(self.cand_bits[rows[first], cols[first]]).sum())
+
+        # Mark the squares and numbers as changed
+        self.change_count+=count
+        self.clock+=1
+        self.square_stamp[rows, cols]=self.clock
+        self.num_stamp[self.unpack_bits(np.bitwise_or.reduce(bits))]=self.clock
+        return count
+
+
+    def mark_all_changed(self):
+        # Makes every rule look at everything again. Used when cand_bits or grid
+        # are replaced wholesale, like when Rule 5 goes back to before it guessed.
+
+        self.clock+=1
+        self.square_stamp[:]=self.clock
+        self.num_stamp[:]=self.clock
+        self.rule_0_full=True
+        self.new_fills=[]
+        self.count_units()
+
+
+    def count_units(self):
+        # Counts the numbers filled in in every set from scratch for unit_counts
+
+        nums=self.geom.units(self.grid)
+        units, pos = np.nonzero((nums>0)&(nums<=self.size))
+        counts=np.bincount(units*self.size+nums[units, pos]-1, minlength=3*self.size*self.size)
+        self.unit_counts=counts.reshape(3*self.size, self.size)
+
+
+    def count_nums(self, rows, cols, sign):
+        # Adds sign to unit_counts for the numbers in grid at rows, cols, which are all different squares
+
+        nums=self.grid[rows, cols]
+        ok=(nums>0)&(nums<=self.size)
+        if not ok.any():
+            return
+        np.add.at(self.unit_counts, (self.geom.square_units[rows[ok], cols[ok]], nums[ok,None]-1), sign)
+
+
+    def changed_since(self, rows, cols, seen):
+        # Whether any of the squares at rows, cols have changed since the clock read seen.
+        # Always True when not working incrementally.
+
+        return not self.incremental or self.square_stamp[rows, cols].max()>seen
+
+
+    def fill(self, rows, cols, nums):
+        # Fills solved numbers into grid and remembers the squares for Rule 0.
+        # If a square is given more than once, the last number given for it wins.
+
+        rows, cols, nums = np.broadcast_arrays(rows, cols, nums)
+        rows, cols, nums = rows.ravel(), cols.ravel(), nums.ravel()
+        if not len(rows):
+            return
+        if len(np.unique(rows*self.size+cols))<len(rows):
+            last=len(rows)-1-np.unique((rows*self.size+cols)[::-1], return_index=True)[1]
+            rows, cols, nums = rows[last], cols[last], nums[last]
+
+        if self.trail is not None:
+            self.trail.append((self.grid, rows, cols, self.grid[rows, cols]))
+        elif self.tracing is not None:
+            self.tracing.record(self.num_steps, True, rows, cols, nums)
+        self.count_nums(rows, cols, -1)
+        self.grid[rows, cols]=nums
+        self.count_nums(rows, cols, 1)
+        self.new_fills.append((rows, cols))
+        if self.on_fill is not None:
+            self.on_fill(self, rows, cols, nums)
+
+
+    def undo(self, mark, count):
+        # Undoes the changes on the trail back to its first mark entries, and puts back
+        # change_count as it was then. The squares put back are marked as changed.
+
+        while len(self.trail)>mark:
+            array, rows, cols, old = self.trail.pop()
+            if array is self.grid:
+                self.count_nums(rows, cols, -1)
+                array[rows, cols]=old
+                self.count_nums(rows, cols, 1)
+            else:
+                array[rows, cols]=old
+            self.clock+=1
+            self.square_stamp[rows, cols]=self.clock
+        self.num_stamp[:]=self.clock
+        self.change_count=count
+        # Everything was propagated before the guess, so Rule 0 has nothing left over
+        self.new_fills=[]
+
+
+    def update_set(self, rows, cols, X):
+        # Writes back a set of squares' candidate lists after a rule has worked on a copy,
+        # by eliminating whatever the rule removed
+
+        removed=self.cand_bits[rows, cols]&~X
+        changed=removed!=0
+        if changed.any():
+            self.eliminate(rows[changed], cols[changed], removed[changed])
+
+
+    def check_limits(self, guess=False):
+        # Raises Solve_Interrupted if the solve has been cancelled or has used up its time or steps,
+        # or with guess, if it's about to make a guess and has used up its guesses
+
+        if self.cancel is not None and self.cancel.is_set():
+            raise Solve_Interrupted('cancelled', "The solve was cancelled")
+        if self.deadline is not None and time.perf_counter()>=self.deadline:
+            raise Solve_Interrupted('budget_exhausted', "Ran out of time")
+        if self.max_steps is not None and self.num_steps>=self.max_steps:
+            raise Solve_Interrupted('budget_exhausted', "Used up %d steps" % self.max_steps)
+        if guess and self.max_guesses is not None and self.search_nodes>=self.max_guesses:
+            raise Solve_Interrupted('budget_exhausted', "Used up %d guesses" % self.max_guesses)
+
+
+    def Block_num(self, i, j):
+        # Calculates the block number of a square based on its row and column number
+        
+        return self.block_h*(i//self.block_h)+j//self.block_w
+
+    
+    def Rule_0(self):
+        # Applies Rule 0 to the entire grid.
+        # Rule 0: Eliminate candidates of squares if there is already a square in that 
+        # row, column, or block with a solved number
+
+        # Everything from the squares solved before has already been eliminated,
+        # so there is only something to do if squares were filled in since the last time
+        if not (self.rule_0_full or self.new_fills or not self.incremental):
+            return
+
+        # The solved numbers in every row, column, and block, as bits
+        size=self.size
+        used=self.pack_bits(self.unit_counts>0)
+
+        # Each square loses the numbers already in its row, column, and block.
+        # If the sqaure already has a value, there are no other potential candidates
+        nots=used[:size,None]|used[None,size:2*size]|used[2*size:][self.block_nums]
+        nots[self.grid!=0]=self.full_bits
+
+        rows, cols = np.nonzero(self.cand_bits&nots)
+        if len(rows):
+            self.eliminate(rows, cols, nots[rows, cols])
+
+        self.rule_0_full=False
+        self.new_fills=[]
+                    
+    
+    
+    def eliminate_view(self, remove):
+        # Eliminates the candidates that are True in booleans shaped like block_view of cand_cube,
+        # all in one go. Returns the number of candidates removed.
+
+        bits=self.pack_bits(remove.reshape(self.size, self.size, self.size))
+        rows, cols = bits.nonzero()
+        return self.eliminate(rows, cols, bits[rows, cols])
+
+
+    def Rule_1(self):
+        # Applies Rule 1 to the entire grid: the columns, then the rows, then the blocks.
+        # The candidates are looked at through block_view, so the rows and columns are done the same way
+        # without transposing anything, and every part removes its candidates with one masked write.
+
+        size=self.size
+        geom=self.geom
+
+        # The columns and then the rows, each worked out from the candidates at its start.
+        # Only look at the lines that have changed since the last time.
+        for rows in [False, True]:
+            units=self.inds if rows else size+self.inds
+            lines=np.ones(size, dtype=bool)
+            if self.incremental:
+                lines=self.square_stamp.max(axis=1 if rows else 0)>self.rule_1_seen[units]
+            self.rule_1_seen[units[lines]]=self.clock
+            if lines.any():
+                self.eliminate_view(geom.line_claims(geom.block_view(self.cand_cube()), rows, lines))
+
+        # The blocks, a wave at a time so that each block sees what the blocks before it eliminated
+        view=None
+        for blocks in geom.block_waves():
+            if self.incremental:
+                stamps=geom.block_view(self.square_stamp).max(axis=(1,3))
+                blocks=blocks&(stamps>self.rule_1_seen[2*size:].reshape(stamps.shape))
+            if not blocks.any():
+                continue
+            self.rule_1_seen[2*size:][blocks.ravel()]=self.clock
+            if view is None:
+                view=geom.block_view(self.cand_cube())
+            if self.eliminate_view(geom.block_pointing(view, blocks)):
+                view=None
+
+
+    def Rule_2_X(self, X, group_size=2):
+        # Applies Condition 2 of Rule 2 with group_size to a single set of squares from
+        # a row, column, or block, given as an array of candidate bitmasks
+        # Also functions as the logic for x-wing when fed a the grid of candidates for a single number
+        
+        squares_sum=popcount(X) # The number of candidates each square in the set has
+
+        # Proceed only if there are as many unsolved squares in the set as twice group_size
+        if (squares_sum>0).sum()>=(group_size*2):
+
+            squares_sum_cond=(squares_sum>1)&(squares_sum<=group_size) # The condition array with True values in the
+                # positions where the squares have up to group_size candidates
+            squares=self.inds[squares_sum_cond].tolist() # The indices of the squares which have up to group_size
+                # candidates in the set
+
+            # Proceed if the set has more than group_size squares with up to group_size candidates
+            if len(squares)>=group_size:
+
+                # Go through the combinations of group_size of those squares in order, adding one square at a
+                # time to the union of their candidates, and skip every combination starting with the squares
+                # so far as soon as the union has more than group_size numbers in it.
+                # Nothing can be removed from those squares while skipping them (a group would have to include
+                # them all), so this finds the same groups as trying every combination one at a time.
+                bits=X.tolist()
+                changed=False
+                comb=[] # Positions in squares of the squares in the combination so far
+                unions=[0] # unions[k] is the union of the candidates of the first k squares of comb
+                nxt=0 # The position in squares of the next square to try adding
+                nodes=0
+                while True:
+                    if len(comb)<group_size and nxt<=len(squares)-(group_size-len(comb)):
+                        union=unions[-1]|bits[squares[nxt]]
+                        nodes+=1
+                        if not nodes%1024:
+                            self.check_limits()
+                        if bin(union).count('1')>group_size:
+                            nxt+=1
+                        elif len(comb)+1<group_size:
+                            comb.append(nxt)
+                            unions.append(union)
+                            nxt+=1
+                        else:
+                            # Condition 2 is met: the combination of squares only has candidates for
+                            # group_size numbers between them, so remove those numbers as candidates
+                            # from all the other squares in the set
+                            group=[squares[k] for k in comb]+[squares[nxt]]
+                            for k in range(len(bits)):
+                                if k not in group and bits[k]&union:
+                                    bits[k]&=~union
+                                    changed=True
+                            nxt+=1
+                        if self.rule_2_max_nodes is not None and nodes>=self.rule_2_max_nodes:
+                            break
+                    elif comb:
+                        nxt=comb.pop()+1
+                        unions.pop()
+                    else:
+                        break
+
+                if changed:
+                    X[:]=bits
+                            
+        return X
+            
+        
+    def Rule_2_group_size(self, group_size=2):
+        # Applies both conditions of Rule 2 and X-wing with group_size to the whole grid,
+        # skipping the sets and numbers that haven't changed since the last time at this group_size
+
+        seen=self.rule_2_seen.setdefault(group_size, np.full(4*self.size, -1))
+        
+        for i in range(self.size):
+            self.check_limits()
+            
+            # Apply to the ith row
+            self.Rule_2_set(np.full(self.size, i), self.inds, group_size, seen, i)
+
+            # The ith column
+            self.Rule_2_set(self.inds, np.full(self.size, i), group_size, seen, self.size+i)
+            
+            # The ith block
+            self.Rule_2_set(self.geom.block_rows[i], self.geom.block_cols[i], group_size, seen, 2*self.size+i)
+            
+            # Apply to candidates of number i for x-wing.
+            # Each row of the grid becomes a bitmask of the columns with i as a candidate.
+            if self.incremental and self.num_stamp[i]<=seen[3*self.size+i]:
+                continue
+            seen[3*self.size+i]=self.clock
+
+            bit=self.bit_table[i]
+            plane=(self.cand_bits&bit)!=0
+            X=self.pack_bits(plane)
+            X=self.Rule_2_X_both(X, group_size)
+            rows, cols = np.nonzero(plane&~self.unpack_bits(X))
+            if len(rows):
+                self.eliminate(rows, cols, bit)
+
+
+    def Rule_2_X_both(self, X, group_size=2):
+        # Applies Rule_2_X to a set of squares and to its transpose
+
+        X=self.Rule_2_X(X, group_size)
+        Xt=self.transpose_bits(X)
+        new_Xt=self.Rule_2_X(Xt.copy(), group_size)
+        # Only transpose back if something was removed
+        if (new_Xt!=Xt).any():
+            X=self.transpose_bits(new_Xt)
+        return X
+
+
+    def Rule_2_set(self, rows, cols, group_size, seen, unit):
+        # Applies both conditions of Rule 2 to the set of squares at rows, cols,
+        # if it has changed since seen[unit]
+
+        if self.changed_since(rows, cols, seen[unit]):
+            seen[unit]=self.clock
+            X=self.Rule_2_X_both(self.cand_bits[rows, cols], group_size)
+            self.update_set(rows, cols, X)
+    
+    
+    def Rule_2(self):
+        # Applies Rule 2 to the whole grid, considering group_size up to size//2 as necessary
+        
+        group_size=2
+
+        # A set with m solved squares can only have a group up to (size-m)//2, and the same goes for
+        # the numbers of a set, and the rows and columns with candidates for a number for x-wing.
+        # Nothing changes until something is found, so there is no point looking past the biggest.
+        unit_bits=np.bitwise_or.reduce(self.geom.units(self.cand_bits), axis=1)
+        unsolved=max((self.geom.units(self.cand_bits)!=0).sum(axis=1).max(), popcount(unit_bits).max(),
+                     self.unpack_bits(unit_bits[:2*self.size].reshape(2, self.size)).sum(axis=1).max())
+        max_group_size=min(self.size//2, unsolved//2)
+        
+        # Run the loop checking with increasing group_size until a change is made
+        # somewhere in cand_bits
+        count=self.change_count
+        while group_size<=max_group_size and self.change_count==count:
+            
+            #print("  Group size: ", group_size)
+            self.Rule_2_group_size(group_size)
+            self.max_group_size=max(self.max_group_size, group_size)
+            
+            group_size+=1
+            
+    
+    def Rule_3(self):
+        # Applies rule 3 (y-wing) to the whole grid.
+        # Two squares with two candidates each, {x, z} and {y, z}, that don't intersect each other, and a third
+        # square {x, y} that intersects both make a y-wing: whichever of x or y the third square turns out to be,
+        # one of the other two has to be z. So z is eliminated from every square intersecting both of them.
+        # All the squares with two candidates are compared with each other at once.
+        
+        # Find the row, column, and block number of the squares with exactly 2 candidates
+        cands_sum_cond=popcount(self.cand_bits)==2 # Boolean array for which squares have two candidates
+        pairs_rows, pairs_cols = np.where(cands_sum_cond) # The row and column numbers of the squares with two candidates
+        pairs_blocks=self.block_nums[cands_sum_cond] # The block numbers for the squares with two candidates
+        pairs_bits=self.cand_bits[cands_sum_cond] # The candidate bitmasks for the squares with two candidates
+
+        # Any y-wing made only of squares that haven't changed since the last time was already used then
+        fresh=self.square_stamp[pairs_rows, pairs_cols]>self.rule_3_seen
+        if not self.incremental:
+            fresh[:]=True
+        self.rule_3_seen=self.clock
+
+        # intersect[i, j] if two-candidate squares i and j are in the same row, column, or block
+        intersect=(pairs_rows[:,None]==pairs_rows)|(pairs_cols[:,None]==pairs_cols)|(pairs_blocks[:,None]==pairs_blocks)
+
+        # The outer squares of the y-wings: pairs that don't intersect each other and share exactly one candidate
+        shares_one=popcount(pairs_bits[:,None]&pairs_bits)==1
+        i1, i2 = np.nonzero(np.triu(shares_one&~intersect, 1))
+
+        # The middle square of each has the two candidates they don't share and intersects them both.
+        # Only y-wings with a square that changed since last time can find anything new.
+        middle=(pairs_bits==(pairs_bits[i1]^pairs_bits[i2])[:,None])&intersect[i1]&intersect[i2]
+        middle&=fresh|fresh[i1][:,None]|fresh[i2][:,None]
+        found=middle.any(axis=1)
+        i1, i2 = i1[found], i2[found]
+        if not len(i1):
+            return
+        shared_bits=pairs_bits[i1]&pairs_bits[i2] # The candidate to eliminate for each
+
+        # The squares intersecting both outer squares: where the row of each meets the column of the other,
+        # and the squares in the block of each that are in the row or column of the other
+        rows=[pairs_rows[i1], pairs_rows[i2]]
+        cols=[pairs_cols[i2], pairs_cols[i1]]
+        bits=[shared_bits, shared_bits]
+        for j1, j2 in [(i1, i2), (i2, i1)]:
+            rs=self.geom.block_rows[pairs_blocks[j1]]
+            cs=self.geom.block_cols[pairs_blocks[j1]]
+            meet=(rs==pairs_rows[j2][:,None])|(cs==pairs_cols[j2][:,None])
+            rows.append(rs[meet])
+            cols.append(cs[meet])
+            bits.append(np.broadcast_to(shared_bits[:,None], rs.shape)[meet])
+        self.eliminate(np.concatenate(rows), np.concatenate(cols), np.concatenate(bits))
+    
+    
+    def Rule_4(self):
+        # Applies Rule 4 (chains) to the whole grid.
+        # Every candidate is a statement that is either true or false. Two candidates are strongly linked
+        # when at least one of them has to be true: the only two places left for a number in a row, column,
+        # or block, or the only two candidates of a square. They are weakly linked when they can't both be
+        # true: the same number in two squares of a set, or two numbers in the same square.
+        # Starting from a candidate being true, and separately from it being false, this follows the links
+        # in turns (false to true along strong links, true to false along weak links), which follows every
+        # alternating chain from it at once. If it being true leads to something being both true and false,
+        # it is eliminated. If it being false does, everything that is false when it's true is eliminated.
+        # Otherwise the candidates that come out false either way are eliminated.
+        # That covers simple coloring (following the strong links of one number colors them true and false),
+        # X-chains (chains of one number), and alternating inference chains that switch numbers in squares.
+        # Every candidate is followed at once, with a row of the true and false arrays for each start.
+
+        # Nothing new can be found unless something changed since the last time
+        if self.incremental and self.square_stamp.max()<=self.rule_4_seen:
+            return
+        self.rule_4_seen=self.clock
+
+        size=self.size
+        rows, cols, nums = np.nonzero(self.cand_cube()&(self.grid==0)[:,:,None])
+        num_nodes=len(rows)
+        if not num_nodes or num_nodes>self.chain_max_nodes:
+            return
+
+        # The groups every candidate is in: its number in its row, column, and block, and its square.
+        # A candidate is weakly linked to every other candidate in its groups.
+        units=self.geom.square_units[rows, cols]
+        groups=np.concatenate([units*size+nums[:,None], (rows*size+cols)[:,None]], axis=1)
+        # A group of two is a strong link, unless it's the number in a set that already has it filled in
+        placed=np.concatenate([self.unit_counts.ravel()[groups[:,:3]]>0, np.zeros((num_nodes, 1), dtype=bool)], axis=1)
+
+        # For each kind of group, the order that sorts the candidates by group, where each group starts in that
+        # order, and which group each candidate is in. partners[k] is the other candidate of each strong link,
+        # or num_nodes (an extra column that is always False) if the group isn't one.
+        sorted_groups=[]
+        partners=np.full((4, num_nodes), num_nodes)
+        for k in range(4):
+            order=np.argsort(groups[:,k], kind='stable')
+            new=np.concatenate([[True], np.diff(groups[order, k])!=0])
+            starts=np.flatnonzero(new)
+            which=np.empty(num_nodes, dtype=int)
+            which[order]=np.cumsum(new)-1
+            sorted_groups.append((order, starts, which))
+
+            lengths=np.diff(np.append(starts, num_nodes))
+            pairs=starts[lengths==2]
+            first, second = order[pairs], order[pairs+1]
+            strong=~placed[first, k]
+            partners[k, first[strong]]=second[strong]
+            partners[k, second[strong]]=first[strong]
+
+        def weak(true):
+            # The candidates made false by the true ones: anything sharing a group with one of them
+            false=np.zeros(true.shape, dtype=bool)
+            for order, starts, which in sorted_groups:
+                counts=np.add.reduceat(true[:, order], starts, axis=1, dtype=np.int32)
+                false|=counts[:, which]>true
+            return false
+
+        def strong(false):
+            # The candidates made true by the false ones: the other end of a strong link
+            false=np.concatenate([false, np.zeros((len(false), 1), dtype=bool)], axis=1)
+            true=np.zeros((len(false), num_nodes), dtype=bool)
+            for k in range(4):
+                true|=false[:, partners[k]]
+            return true
+
+        # The first num_nodes rows start from each candidate being true, the rest from it being false
+        eye=np.eye(num_nodes, dtype=bool)
+        true=np.concatenate([eye, np.zeros((num_nodes, num_nodes), dtype=bool)])
+        false=np.concatenate([weak(eye), eye])
+        # Only the rows that got something new last time can get anything new
+        active=np.arange(2*num_nodes)
+        links=0
+        while len(active) and (self.chain_length is None or links<self.chain_length):
+            new_true=true[active]|strong(false[active])
+            changed=(new_true!=true[active]).any(axis=1)
+            active, new_true = active[changed], new_true[changed]
+            true[active]=new_true
+            false[active]|=weak(new_true)
+            links+=1
+            self.check_limits()
+
+        broken=(true&false).any(axis=1)
+        broken_true, broken_false = broken[:num_nodes], broken[num_nodes:]
+        false_true, false_false = false[:num_nodes], false[num_nodes:]
+        # If both are broken the puzzle has no solution, so leave those to the other rules to find out
+        ok=~(broken_true&broken_false)
+        remove=broken_true&ok
+        remove|=(false_true&(broken_false&ok)[:,None]).any(axis=0)
+        remove|=(false_true&false_false&~(broken_true|broken_false)[:,None]).any(axis=0)
+        if remove.any():
+            self.eliminate(rows[remove], cols[remove], self.bit_table[nums[remove]])
+
+
+    def Rule_5(self):
+        # Applies Rule 5: guess, using the rules up to search_rule to follow up on every guess,
+        # and go back and guess differently whenever that runs into a contradiction.
+        # Leaves the solution in grid if it finds one. Otherwise everything is put back and
+        # nothing is eliminated, so the solve loop stops.
+
+        # The first time we have to start guessing, permanently record the current state of
+        # cand_bits and grid
+        if self.rule_5_count==0:
+            self.current_bits=self.cand_bits.copy()
+            self.current_grid=self.grid.copy()
+        self.rule_5_count+=1
+        if self.tracing is not None:
+            before=(self.cand_bits.copy(), self.grid.copy())
+
+        # The rules are already stuck, or Rule 5 wouldn't have been called
+        if self.search(limit=1, propagate=False):
+            if self.tracing is not None:
+                # Nothing was traced while guessing, so trace what the guessing left behind
+                rows, cols = np.nonzero(before[0]!=self.cand_bits)
+                self.tracing.record(self.num_steps, False, rows, cols, before[0][rows, cols]&~self.cand_bits[rows, cols])
+                rows, cols = np.nonzero(before[1]!=self.grid)
+                self.tracing.record(self.num_steps, True, rows, cols, self.grid[rows, cols])
+            # Solved. Clear the candidates of the filled in squares the way Rule 0 would have.
+            self.eliminate(self.row_nums, self.col_nums, self.full_bits)
+
+
+    def search(self, limit=1, propagate=True, keep=True):
+        # Searches for solutions by guessing (see guess_choices), following up every guess with
+        # propagate, and going back to the last guess with others left to try whenever that
+        # runs into a contradiction or a solution.
+        # Stops after finding limit solutions and returns the number found.
+        # With keep, the last solution is left in grid if it stopped there. Otherwise everything
+        # is put back the way it was. With propagate=False, the rules are assumed to be stuck already,
+        # though they may have left a contradiction behind.
+
+        self.trail=[]
+        count=self.change_count
+        # What Rule 0 still had to do, for when everything is put back
+        rule_0=(self.rule_0_full, list(self.new_fills))
+        # The guesses that still have others to try, as
+        # (trail length, change_count, guess_choices left to try) before each guess
+        stack=[]
+        found=0
+        try:
+            if propagate:
+                state=self.propagate()
+            else:
+                # A square with no candidates left would otherwise be picked to guess on
+                state=-1 if self.contradiction() else 0
+            while True:
+
+                if state==1:
+                    found+=1
+                    if found>=limit:
+                        break
+                self.check_limits(guess=True)
+
+                # Stuck: work out what to guess
+                if state==0:
+                    stack.append((len(self.trail), self.change_count, self.guess_choices()))
+
+                # Contradiction, or a solution when looking for more:
+                # go back to the last guess with others left to try
+                else:
+                    self.search_backtracks+=state==-1
+                    while stack and not stack[-1][2]:
+                        stack.pop()
+                    if not stack:
+                        break
+                    self.undo(*stack[-1][:2])
+
+                # Guess the next number for its square by eliminating all its other candidates
+                row, col, bit = stack[-1][2].pop()
+                self.search_nodes+=1
+                self.eliminate(row, col, self.cand_bits[row, col]&~bit)
+                state=self.propagate()
+
+        except Solve_Interrupted:
+            # Out of time or cancelled. Nothing found by guessing can be kept, so put everything back.
+            self.undo(0, count)
+            self.rule_0_full, self.new_fills = rule_0
+            self.trail=None
+            raise
+
+        if not (keep and found>=limit):
+            self.undo(0, count)
+            self.rule_0_full, self.new_fills = rule_0
+        self.trail=None
+        return found
+
+
+    def guess_choices(self):
+        # The guesses search tries in turn when the rules are stuck, as a list of (row, col, bit) to be
+        # popped off the end: the candidates of the blank square with the fewest of them, lowest first,
+        # or if some number has fewer squares left in a row, column, or block, each of those squares.
+        # Every number left in a set has at least two squares and every blank square two candidates,
+        # or the rules wouldn't be stuck. Without the sets, a puzzle where no square is down to a few
+        # candidates can take thousands of times as many guesses.
+
+        blank_bits=np.where(self.grid==0, popcount(self.cand_bits), self.size+1)
+        square=np.argmin(blank_bits)
+        unit_cube=self.geom.units(self.cand_cube()) # [set, square in set, number]
+        places=np.where(self.unit_counts>0, self.size+1, unit_cube.sum(axis=1))
+        unit=np.argmin(places)
+
+        if places.flat[unit]<blank_bits.flat[square]:
+            unit, num = divmod(unit, self.size)
+            pos=np.flatnonzero(unit_cube[unit, :, num])
+            rows, cols = self.geom.unit_rows[unit, pos], self.geom.unit_cols[unit, pos]
+            bits=np.full(len(pos), self.bit_table[num])
+        else:
+            row, col = divmod(square, self.size)
+            bits=self.bit_table[self.unpack_bits(self.cand_bits[row, col])]
+            rows, cols = np.full(len(bits), row), np.full(len(bits), col)
+        return list(zip(rows, cols, bits))[::-1]
+
+
+    def count_solutions(self, limit=2, timeout=None):
+        # Counts the solutions of the puzzle from where it is now, stopping once it finds limit of them,
+        # so with limit=2 it tells whether the puzzle has no solution, one, or more than one.
+        # Leaves the puzzle the way it was. Raises Solve_Interrupted if it takes more than timeout seconds.
+
+        counts=(self.num_steps, self.search_nodes, self.search_backtracks, self.solved)
+        self.deadline=None if timeout is None else time.perf_counter()+timeout
+        try:
+            return self.search(limit, keep=False)
+        finally:
+            self.deadline=None
+            self.num_steps, self.search_nodes, self.search_backtracks, self.solved = counts
+
+
+    def propagate(self):
+        # Follows up on a guess: fills in values with solve_step and applies the rules up to
+        # search_rule, over and over until nothing changes.
+        # Returns 1 if that solves the puzzle, -1 if it runs into a contradiction, and 0 if it gets stuck.
+
+        while True:
+            self.check_limits()
+            self.solve_step()
+            self.num_steps+=1
+
+            if self.contradiction():
+                return -1
+            if self.is_solved():
+                return 1
+
+            count=self.change_count
+            for rule in self.rule_func_list[:self.search_rule+1]:
+                rule()
+                if self.change_count!=count:
+                    break
+            else:
+                return 0
+
+
+    def contradiction(self):
+        # Checks whether the puzzle can no longer be solved: a blank square with no candidates,
+        # a number in a set that is neither filled in nor a candidate, or a number filled in twice in a set
+
+        blank=self.grid==0
+        if (blank&(self.cand_bits==0)).any():
+            return True
+
+        used=self.pack_bits(self.unit_counts>0)
+        available=np.bitwise_or.reduce(self.geom.units(self.cand_bits), axis=1)|used
+        return bool((available!=self.full_bits).any() or (self.unit_counts>1).any())
+        
+
+    
+    def is_solved(self):
+        # Checks if the grid is solved and updates and returns the solved state as a boolean value
+        
+        # Solved when there is exactly one of every number in each row, column, and block.
+        # A blank square (or one with something that isn't a number) leaves a number out of its sets.
+        self.solved=bool((self.unit_counts==1).all())
+        return self.solved
+    
+    
+    def solve_step(self):
+        # Based on the current list of candidates, fill in any squares with only one
+        # candidate or where a square has the only candidate for that value in its
+        # row, column, or block. They are all worked out from the same candidates and filled in at once.
+
+        # Spots with only one candidate
+        rows, cols = np.nonzero(popcount(self.cand_bits)==1)
+        nums=bit_index(self.cand_bits[rows, cols])
+
+        # Spots where a candidate is the only one of its value in its row, column, or block.
+        # Sum the candidates of every set, and any number with a sum of 1 has only one square left.
+        unit_cube=self.geom.units(self.cand_cube()) # [set, square in set, number]
+        units, unit_nums = np.nonzero(unit_cube.sum(axis=1)==1)
+        pos=unit_cube[units, :, unit_nums].argmax(axis=1)
+
+        self.fill(np.concatenate([rows, self.geom.unit_rows[units, pos]]),
+                  np.concatenate([cols, self.geom.unit_cols[units, pos]]),
+                  np.concatenate([nums, unit_nums])+1)
+
+                
+                
+    def step(self):
+        # Advances the solving procedure by one step: applies the rules until one of them
+        # eliminates a candidate, then fills in values with solve_step.
+        # Returns True if there is more to do, and False once the puzzle is solved or deemed unsolvable.
+
+        count=self.change_count # The number of candidates eliminated before this step
+        # Only keep track of the rules if somebody wants to know
+        instrumented=self.stats is not None or self.on_rule_start is not None or self.on_rule_end is not None
+
+        # Try eliminating candidates using all the rules until a change is made to cand_bits
+        # or it runs out of rules
+        rule=0
+        while self.change_count==count and rule<len(self.rule_func_list):
+            self.check_limits()
+            if self.tracing is not None:
+                self.tracing.rule=rule
+
+            # Apply the current rule
+            # print("Rule %d"%rule)
+            if instrumented:
+                self.run_rule(rule)
+            else:
+                self.rule_func_list[rule]()
+            self.max_rule=max(rule, self.max_rule)
+            rule+=1
+
+        # If no change was made by the Rules, then it is not solved
+        # and there is nothing more to do
+        if self.change_count==count:
+            # Revert cand_bits and grid to the state before the program started guessing
+            self.cand_bits=self.current_bits
+            self.grid=self.current_grid
+            self.mark_all_changed()
+            #print("I couldn't solve it.")
+            return False
+
+        if self.tracing is not None:
+            self.tracing.rule=SOLVE_STEP
+        if self.stats is None:
+            self.solve_step() # Fill in values according to the current state of cand_bits
+        else:
+            blanks=np.count_nonzero(self.grid==0)
+            self.solve_step()
+            self.stats['fills']+=int(blanks-np.count_nonzero(self.grid==0))
+        self.num_steps+=1
+
+        # Keep going unless that solved the puzzle
+        if self.is_solved():
+            #print("Solved in %d steps."%self.num_steps)
+            #print("The highest rule used was Rule %d."%self.max_rule)
+            return False
+        return True
+
+
+    def run_rule(self, rule):
+        # Applies the rule with index rule in rule_func_list, keeping stats and calling the hooks
+
+        if self.on_rule_start is not None:
+            self.on_rule_start(self, rule)
+
+        count=self.change_count
+        start=time.perf_counter()
+        self.rule_func_list[rule]()
+        seconds=time.perf_counter()-start
+        eliminated=self.change_count-count
+
+        if self.stats is not None:
+            rule_stats=self.stats['rules'][rule]
+            rule_stats['calls']+=1
+            rule_stats['time']+=seconds
+            rule_stats['eliminated']+=eliminated
+            rule_stats['no_ops']+=eliminated==0
+        if self.on_rule_end is not None:
+            self.on_rule_end(self, rule, eliminated, seconds)
+
+
+    def get_stats(self):
+        # The stats kept by step() along with the other counts kept while solving, as a dictionary.
+        # The rules are listed by name. Rule 5 calls other rules and solve_step while it guesses,
+        # and those are counted as part of Rule 5.
+
+        if self.stats is None:
+            return None
+        return {'rules': {rule.__name__: dict(rule_stats)\
+                          for rule, rule_stats in zip(self.rule_func_list, self.stats['rules'])},
+                'fills': self.stats['fills'],
+                'num_steps': self.num_steps,
+                'max_rule': self.max_rule,
+                'max_group_size': self.max_group_size,
+                'guesses': self.search_nodes,
+                'backtracks': self.search_backtracks}
+
+
+    def solve_loop(self, timeout=None, max_steps=None, max_guesses=None, cancel=None, trace=False):
+        # Iterates the solving procedure until the puzzle is solved or deemed unsolvable, or until
+        # it has taken timeout seconds, max_steps steps (counting the ones taken while guessing), or
+        # max_guesses guesses, or cancel (a threading.Event or the like) is set.
+        # Returns the status, also kept in status: 'solved', 'unsolvable', 'budget_exhausted', or 'cancelled'.
+        # When it stops early, grid and cand_bits are left the way they were before the rule it stopped in
+        # started guessing, so everything in them still follows from the puzzle.
+        # With trace=True, what every rule did is kept in trace as a Sudoku_Trace.
+
+        self.deadline=None if timeout is None else time.perf_counter()+timeout
+        self.max_steps=max_steps
+        self.max_guesses=max_guesses
+        self.cancel=cancel
+        if trace:
+            self.trace=self.tracing=Sudoku_Trace(self.grid.copy(), self.cand_bits.copy(), self.block_w)
+        try:
+            while self.step():
+                pass
+            self.status='solved' if self.is_solved() else 'unsolvable'
+        except Solve_Interrupted as interrupted:
+            self.status=interrupted.status
+        finally:
+            self.deadline=self.max_steps=self.max_guesses=self.cancel=None
+            self.tracing=None
+        return self.status
+
+
+    def solve_exact_cover(self, timeout=None):
+        # Solves the puzzle as an exact cover problem with Algorithm X instead of the rules.
+        # Much faster when only the solution is wanted, but num_steps and max_rule are left alone
+        # so it can't be used to grade puzzles. Fills in grid, solved, and status like solve_loop,
+        # giving up with 'budget_exhausted' after timeout seconds.
+
+        deadline=None if timeout is None else time.perf_counter()+timeout
+
+        Y=self.geom.cover_cols.tolist()
+        X={j: set() for j in range(4*self.size*self.size)}
+        for r, cols in enumerate(Y):
+            for j in cols:
+                X[j].add(r)
+
+        # Take the choices for the numbers already in the grid first, giving up if two of them clash
+        rows, cols = np.nonzero(self.grid)
+        for r in ((rows*self.size+cols)*self.size+self.grid[rows, cols]-1).tolist():
+            if not take_choice(X, Y, r):
+                self.status='unsolvable'
+                return self.is_solved()
+
+        # None if it gave up, False if there is no solution
+        solution=next(algorithm_x(X, Y, deadline=deadline), False)
+        if solution is None:
+            self.status='budget_exhausted'
+        elif solution is False:
+            self.status='unsolvable'
+        else:
+            squares, nums = np.divmod(solution, self.size)
+            rows, cols = np.divmod(squares, self.size)
+            self.fill(rows, cols, nums+1)
+            # Clear the candidates of the filled in squares the way Rule 0 would have
+            self.eliminate(self.row_nums, self.col_nums, self.full_bits)
+            self.status='solved' if self.is_solved() else 'unsolvable'
+        return self.is_solved()
+
+
+    def solve(self, method=None, **limits):
+        # Solves the puzzle with the given method, or the one given when the puzzle was created:
+        # 'rules' works through the rules with solve_loop, and 'exact_cover' uses solve_exact_cover.
+        # The limits (timeout, max_steps, max_guesses, cancel) and trace are passed on to solve_loop.
+        # 'exact_cover' can only be given timeout. Returns whether the puzzle was solved.
+
+        method=self.method if method is None else method
+        if method=='rules':
+            self.solve_loop(**limits)
+        elif method=='exact_cover':
+            if set(limits)-{'timeout'}:
+                raise ValueError("The 'exact_cover' method can only be given a timeout")
+            self.solve_exact_cover(**limits)
+        else:
+            raise ValueError("Unknown solving method %r" % method)
+        return self.is_solved()
+            
+            
+class Sudoku_Batch:
+# A stack of puzzles of the same size and block width solved together. Rule 0, Rule 1, and
+# solve_step are done with numpy over the whole stack at once, which gives the same result as
+# doing them one puzzle at a time. Puzzles that need more than that are handed to Sudoku_Puzzle.
+
+    def __init__(self, grids, block_w=3):
+        # grids is an N x size x size array of puzzles
+
+        self.grid=np.array(grids).astype(int)
+        self.size=self.grid.shape[1]
+        self.block_w=block_w
+        self.block_h=self.size//self.block_w
+        self.geom=get_geometry(self.size, self.block_w)
+        self.bit_table=self.geom.bit_table
+        self.full_bits=self.geom.full_bits
+
+        # The same as the attributes of Sudoku_Puzzle, with an extra first axis for the puzzle
+        self.cand_bits=np.full(self.grid.shape, self.full_bits, dtype=self.geom.dtype)
+        self.num_steps=np.zeros(len(self.grid), dtype=int)
+        self.max_rule=np.zeros(len(self.grid), dtype=int)
+        self.solved=np.zeros(len(self.grid), dtype=bool)
+        self.status=None # After solve_loop, a list of how it ended for every puzzle (see Sudoku_Puzzle.solve_loop)
+
+        # With solve_loop(trace=True), a Sudoku_Trace for every puzzle. While solving, the changes
+        # to all of them are kept together as (which, steps, rule, fill, indices, values), where which
+        # and steps are the puzzles looked at and their num_steps, and indices are into which x size x size.
+        self.traces=None
+        self.changes=None
+
+
+    def record(self, which, rule, old, new):
+        # Records the candidates eliminated by rule from the puzzles with indices which, given
+        # their candidates before and after, for the traces
+
+        removed=old&~new
+        k=np.flatnonzero(removed) # A lot faster than nonzero on a 3D array
+        self.changes.append((which, self.num_steps[which], rule, False, k, removed.ravel()[k]))
+
+
+    def unpack_bits(self, bits):
+        # Expands an array of bitmasks into booleans with an extra last axis for the numbers
+
+        return (bits[...,None]&self.bit_table)!=0
+
+
+    def pack_bits(self, bools):
+        # The inverse of unpack_bits
+
+        return np.dot(bools, self.bit_table).astype(self.geom.dtype, copy=False)
+
+
+    def Rule_0(self, which):
+        # Applies Rule 0 to the puzzles with indices which.
+        # Returns a boolean array of which of them had candidates eliminated.
+
+        grid=self.grid[which]
+        cand_bits=self.cand_bits[which]
+
+        # The bit of the solved number of every square, zero if it is blank
+        solved=grid!=0
+        num_bits=np.where(solved, self.bit_table[grid-1], self.geom.dtype(0))
+
+        # The solved numbers in every row, column, and block of every puzzle
+        row_used=np.bitwise_or.reduce(num_bits, axis=2)
+        col_used=np.bitwise_or.reduce(num_bits, axis=1)
+        block_used=np.bitwise_or.reduce(num_bits[:, self.geom.block_rows, self.geom.block_cols], axis=2)
+
+        nots=row_used[:,:,None]|col_used[:,None,:]|block_used[:, self.geom.block_nums]
+        nots[solved]=self.full_bits
+
+        new_bits=cand_bits&~nots
+        self.cand_bits[which]=new_bits
+        if self.changes is not None:
+            self.record(which, 0, cand_bits, new_bits)
+        return (new_bits!=cand_bits).any(axis=(1,2))
+
+
+    def block_view(self, bits):
+        # The candidates of a stack of puzzles as booleans, the way Sudoku_Geometry.block_view
+        # shows them but with the puzzle first: [puzzle, band, row in block, stack, column in block, number]
+
+        return self.unpack_bits(bits).reshape(len(bits), self.block_w, self.block_h, self.block_h, self.block_w, self.size)
+
+
+    def Rule_1(self, which):
+        # Applies Rule 1 to the puzzles with indices which: columns, then rows, then blocks,
+        # done like Sudoku_Puzzle.Rule_1 for every puzzle at once.
+        # Returns a boolean array of which of them had candidates eliminated.
+
+        cand_bits=self.cand_bits[which]
+        new_bits=cand_bits
+        parts=[(self.geom.line_claims, False), (self.geom.line_claims, True)]+\
+              [(self.geom.block_pointing, blocks) for blocks in self.geom.block_waves()]
+        for func, arg in parts:
+            remove=func(self.block_view(new_bits), arg)
+            new_bits=new_bits&~self.pack_bits(remove.reshape(new_bits.shape+(self.size,)))
+        self.cand_bits[which]=new_bits
+        if self.changes is not None:
+            self.record(which, 1, cand_bits, new_bits)
+        return (new_bits!=cand_bits).any(axis=(1,2))
+
+
+    def solve_step(self, which):
+        # Does solve_step on the puzzles with indices which, filling in the same squares
+        # as Sudoku_Puzzle.solve_step
+
+        grid=self.grid[which]
+        cand_bits=self.cand_bits[which]
+
+        # Squares with only one candidate
+        n, rows, cols = np.nonzero(popcount(cand_bits)==1)
+        nums=bit_index(cand_bits[n, rows, cols])
+
+        # Numbers with only one candidate left in a row, column, or block
+        unit_cube=self.unpack_bits(cand_bits[:, self.geom.unit_rows, self.geom.unit_cols]) # [puzzle, set, square, number]
+        unit_n, units, unit_nums = np.nonzero(unit_cube.sum(axis=2)==1)
+        pos=unit_cube[unit_n, units, :, unit_nums].argmax(axis=1)
+
+        # Where a square is given more than once the last one wins, the same as in fill()
+        n=np.concatenate([n, unit_n])
+        rows=np.concatenate([rows, self.geom.unit_rows[units, pos]])
+        cols=np.concatenate([cols, self.geom.unit_cols[units, pos]])
+        grid[n, rows, cols]=np.concatenate([nums, unit_nums])+1
+        self.grid[which]=grid
+        if self.changes is not None:
+            # The numbers go in with the bits of the eliminations, so they get the same dtype
+            k=np.sort((n*self.size+rows)*self.size+cols)
+            k=k[np.diff(k, prepend=-1)!=0] # Each square once, faster than np.unique
+            self.changes.append((which, self.num_steps[which], SOLVE_STEP, True, k,
+                                 grid.ravel()[k].astype(self.geom.dtype)))
+
+
+    def is_solved(self, which):
+        # Checks whether the puzzles with indices which are solved, and updates solved for them
+
+        grid=self.grid[which]
+        solved=((grid>0)&(grid<=self.size)).all(axis=(1,2))
+        num_bits=np.where(solved[:,None,None], self.bit_table[grid-1], self.geom.dtype(0))
+        units_used=np.bitwise_or.reduce(num_bits[:, self.geom.unit_rows, self.geom.unit_cols], axis=2)
+        solved&=(units_used==self.full_bits).all(axis=1)
+        self.solved[which]=solved
+        return solved
+
+
+    def solve_loop(self, trace=False, timeout=None):
+        # Solves every puzzle in the batch, giving the same grid, num_steps, and max_rule
+        # that Sudoku_Puzzle.solve_loop would for each of them, and with trace=True the same traces in traces.
+        # Every puzzle that needs more than Rules 0 and 1 gets timeout seconds for the rest.
+
+        if trace:
+            grids, cand_bits = self.grid.copy(), self.cand_bits.copy()
+            self.traces=[Sudoku_Trace(grids[i], cand_bits[i], self.block_w) for i in range(len(grids))]
+            self.changes=[]
+        active=np.arange(len(self.grid)) # The puzzles still being solved in the batch
+        stuck=[] # The puzzles that need more than Rules 0 and 1
+
+        while len(active):
+
+            # Rule 0, then Rule 1 on the puzzles Rule 0 didn't change
+            changed=self.Rule_0(active)
+            rest=active[~changed]
+            self.max_rule[rest]=np.maximum(self.max_rule[rest], 1)
+            changed_1=self.Rule_1(rest)
+            stuck.append(rest[~changed_1])
+
+            # Fill in values in the puzzles that changed
+            active=np.sort(np.concatenate([active[changed], rest[changed_1]]))
+            self.solve_step(active)
+            self.num_steps[active]+=1
+            active=active[~self.is_solved(active)]
+
+        # Sorting out which changes go with which puzzle takes about as long as recording them,
+        # so it's left until one of the traces is looked at
+        if trace:
+            batch={'changes': self.changes, 'size': self.size, 'count': len(self.grid), 'split': None}
+            for i, puzzle_trace in enumerate(self.traces):
+                puzzle_trace.batch=(batch, i)
+            self.changes=None
+
+        # Carry on with the rest of the rules one puzzle at a time
+        self.status=['solved']*len(self.grid)
+        for i in np.concatenate(stuck):
+            puzzle=Sudoku_Puzzle(self.grid[i], self.block_w)
+            puzzle.cand_bits=self.cand_bits[i].copy()
+            puzzle.num_steps=self.num_steps[i]
+            puzzle.max_rule=self.max_rule[i]
+            self.status[i]=puzzle.solve_loop(timeout=timeout, trace=trace)
+            if trace:
+                self.traces[i].extend(puzzle.trace)
+
+            self.grid[i]=puzzle.grid
+            self.cand_bits[i]=puzzle.cand_bits
+            self.num_steps[i]=puzzle.num_steps
+            self.max_rule[i]=puzzle.max_rule
+            self.solved[i]=puzzle.is_solved()
+
+
+
+def split_changes(changes, size, count):
+    # Splits up the changes recorded by a Sudoku_Batch of count puzzles (see Sudoku_Batch.changes)
+    # into a list for every puzzle of the (step, rule, fill, rows, cols, values) Sudoku_Trace.record takes,
+    # keeping them in order
+
+    split=[[] for i in range(count)]
+    if not changes:
+        return split
+    lengths=[len(change[4]) for change in changes]
+    n, squares = np.divmod(np.concatenate([change[4] for change in changes]), size*size)
+    # Which puzzle in the batch, and its step, from the puzzle among the ones the change looked at
+    puzzles=np.concatenate([change[0] for change in changes])
+    steps=np.concatenate([change[1] for change in changes])
+    offsets=np.repeat(np.cumsum([0]+[len(change[0]) for change in changes[:-1]]), lengths)
+    puzzles, steps = puzzles[offsets+n], steps[offsets+n]
+    values=np.concatenate([change[5] for change in changes])
+    rules, fills = [np.repeat([change[k] for change in changes], lengths) for k in (2, 3)]
+    rows, cols = np.divmod(squares, size)
+
+    order=np.argsort(puzzles, kind='stable')
+    steps, rules, fills, rows, cols, values = [x[order] for x in (steps, rules, fills, rows, cols, values)]
+    bounds=np.searchsorted(puzzles[order], np.arange(count+1)).tolist()
+    for i in range(count):
+        if bounds[i]<bounds[i+1]:
+            part=slice(bounds[i], bounds[i+1])
+            split[i].append((steps[part], rules[part], fills[part], rows[part], cols[part], values[part]))
+    return split
+
+
+def solve_batch(grids, block_w=3, chunk_size=1024, trace=False):
+    # Solves an N x size x size array of puzzles with Sudoku_Batch, chunk_size puzzles at a time
+    # to keep the memory bounded. Returns the solved grids, a boolean array of which puzzles were
+    # solved, and the max_rule and num_steps of every puzzle, and with trace=True a list of
+    # the Sudoku_Trace of every puzzle after those.
+
+    grids=np.asarray(grids)
+    solution=np.zeros(grids.shape, dtype=int)
+    solved=np.zeros(len(grids), dtype=bool)
+    max_rule=np.zeros(len(grids), dtype=int)
+    num_steps=np.zeros(len(grids), dtype=int)
+    traces=[]
+
+    for start in range(0, len(grids), chunk_size):
+        chunk=slice(start, start+chunk_size)
+        batch=Sudoku_Batch(grids[chunk], block_w)
+        batch.solve_loop(trace)
+        solution[chunk]=batch.grid
+        solved[chunk]=batch.solved
+        max_rule[chunk]=batch.max_rule
+        num_steps[chunk]=batch.num_steps
+        if trace:
+            traces+=batch.traces
+
+    if trace:
+        return solution, solved, max_rule, num_steps, traces
+    return solution, solved, max_rule, num_steps
+
+
+
+# The biggest puzzles the command line and the benchmarks solve with Sudoku_Puzzle. Anything bigger
+# gets a Sudoku_Large.
+LARGE_SIZE=36
+
+
+class Sudoku_Large:
+# A puzzle too big for Sudoku_Puzzle, from about 64x64 up to 1000x1000. Sudoku_Puzzle keeps arrays
+# the size of the whole grid for every number and its rules look through all of them every step, which
+# runs out of memory and time past a few dozen numbers. Here the candidates of every square are packed
+# into size/64 words, the number of candidates every square has and every number has in every set are
+# kept up to date as candidates go, and every set keeps a list of its blank squares. Filling in a square
+# only touches the blank squares of its sets, and the next squares to fill in are found from the counts.
+# Only Rule 0 and the singles of solve_step are done, with guessing like Rule 5 when they get stuck,
+# so max_rule is 0 or 5 and can't be compared with the grades of Sudoku_Puzzle.
+
+    def __init__(self, grid, block_w):
+        # Takes the same grid and block width as Sudoku_Puzzle
+
+        self.grid=np.array(grid, dtype=np.int32)
+        self.size=len(self.grid)
+        self.block_w=block_w
+        self.block_h=self.size//block_w
+        self.words=(self.size+63)//64 # The number of 64 bit words holding the candidates of a square
+        self.flat=self.grid.reshape(-1) # The grid with the squares numbered row*size+col
+
+        self.broken=False # Whether it has run into a contradiction
+        self.trail=None # The changes made while guessing, so they can be undone
+        self.num_steps=0
+        self.max_rule=0
+        self.solved=False
+        self.status=None
+        self.search_nodes=0 # The number of guesses made
+        self.search_backtracks=0 # The number of times a guess led to a contradiction
+        self.deadline=self.max_steps=self.max_guesses=self.cancel=None
+        self.recount()
+
+
+    def recount(self):
+        # Works out the candidates, counts, and blank squares from grid from scratch, the way Rule 0 would
+
+        size=self.size
+        squares=np.arange(size*size, dtype=np.int32)
+        blank=self.flat==0
+        filled=squares[~blank]
+        units=self.units_of(filled)
+
+        # counts[u, n-1] is the number of blank squares in set u with the candidate n, and placed[u, n-1]
+        # the number of times n is filled in in set u, with the sets in the order rows, columns, blocks
+        self.placed=np.zeros((3*size, size), dtype=np.int32)
+        np.add.at(self.placed, (units, self.flat[filled,None]-1), 1)
+        self.broken=bool((self.placed>1).any())
+
+        # The candidates of the blank squares are the numbers not filled in in any of their sets
+        used=self.pack_bits(self.placed>0)
+        full=self.pack_bits(np.ones(size, dtype=bool))
+        self.bits=np.zeros((size*size, self.words), dtype='<u8') # [square, word]
+        units=self.units_of(squares[blank])
+        self.bits[blank]=full&~(used[units[:,0]]|used[units[:,1]]|used[units[:,2]])
+        self.square_counts=np.zeros(size*size, dtype=np.int32) # The number of candidates of every square
+        self.counts=np.zeros((3*size, size), dtype=np.int32)
+        self.change_counts(squares[blank], self.bits[blank], 1)
+
+        # The blank squares of every set, in the same order
+        grid_squares=squares.reshape(size, size)
+        blocks=grid_squares.reshape(size//self.block_h, self.block_h, size//self.block_w, self.block_w)
+        sets=np.concatenate([grid_squares, grid_squares.T, blocks.swapaxes(1, 2).reshape(size, size)])
+        self.open=[unit[blank[unit]] for unit in sets]
+
+
+    # The same limits as Sudoku_Puzzle
+    check_limits=Sudoku_Puzzle.check_limits
+
+
+    def pack_bits(self, bools):
+        # Packs booleans with the numbers on the last axis into words of candidate bits
+
+        padded=np.zeros(bools.shape[:-1]+(64*self.words,), dtype=bool)
+        padded[...,:self.size]=bools
+        return np.packbits(padded, axis=-1, bitorder='little').view('<u8')
+
+
+    def unpack_bits(self, bits):
+        # The inverse of pack_bits
+
+        bytes_=np.ascontiguousarray(bits).view(np.uint8)
+        return np.unpackbits(bytes_, axis=-1, bitorder='little')[...,:self.size].view(bool)
+
+
+    def units_of(self, squares):
+        # The row, column, and block of every square, as the numbers of the sets: shape (len(squares), 3)
+
+        rows, cols = np.divmod(squares, self.size)
+        blocks=self.block_h*(rows//self.block_h)+cols//self.block_w
+        return np.stack([rows, self.size+cols, 2*self.size+blocks], axis=1)
+
+
+    def by_unit(self, units, values):
+        # Groups values (one for each row of units) by the sets in units. Yields (set, values in it).
+
+        flat=units.ravel()
+        values=np.repeat(values, units.shape[1], axis=0)
+        order=np.argsort(flat, kind='stable')
+        flat, values = flat[order], values[order]
+        starts=np.flatnonzero(np.diff(flat, prepend=-1))
+        for u, group in zip(flat[starts].tolist(), np.split(values, starts[1:])):
+            yield u, group
+
+
+    def change_counts(self, squares, bits, sign):
+        # Adds sign to the counts for the candidates bits of the squares, which must all be different
+
+        self.square_counts[squares]+=sign*popcount(bits).sum(axis=1, dtype=np.int32)
+        # A chunk of squares at a time, so the booleans of every candidate never get too big
+        chunk=max(1, (1<<24)//self.size)
+        for start in range(0, len(squares), chunk):
+            which, nums = np.nonzero(self.unpack_bits(bits[start:start+chunk]))
+            units=self.units_of(squares[start:start+chunk][which])
+            np.add.at(self.counts, (units, nums[:,None]), sign)
+
+
+    def eliminate(self, squares, bits):
+        # Eliminates the candidates bits (rows of words) from the squares, which can repeat
+
+        if not len(squares):
+            return
+        order=np.argsort(squares, kind='stable')
+        squares, bits = squares[order], bits[order]
+        starts=np.flatnonzero(np.diff(squares, prepend=-1))
+        squares=squares[starts]
+        bits=np.bitwise_or.reduceat(bits, starts, axis=0)&self.bits[squares]
+        changed=bits.any(axis=1)
+        squares, bits = squares[changed], bits[changed]
+        if not len(squares):
+            return
+
+        self.bits[squares]&=~bits
+        self.change_counts(squares, bits, -1)
+        if self.trail is not None:
+            self.trail.append((squares, bits, None))
+
+
+    def fill(self, squares, nums):
+        # Fills in the numbers nums+1 in the blank squares, which must all be different,
+        # and eliminates them from the blank squares of their sets the way Rule 0 would
+
+        if not len(squares):
+            return
+        self.flat[squares]=nums+1
+        units=self.units_of(squares)
+        np.add.at(self.placed, (units, nums[:,None]), 1)
+        if (self.placed[units, nums[:,None]]>1).any():
+            self.broken=True # The same number twice in a set
+        if self.trail is not None:
+            self.trail.append((squares, None, nums))
+
+        self.eliminate(squares, self.bits[squares])
+        # Every set the squares are in loses them from its blank squares, and their numbers from the
+        # candidates of the rest. A bunch of sets at a time, to keep the arrays of candidates small.
+        peers, peer_bits, pending = [], [], 0
+        for u, new in self.by_unit(units, np.stack([squares, nums], axis=1)):
+            blank=self.open[u]
+            blank=self.open[u]=blank[self.flat[blank]==0]
+            if len(blank):
+                bits=np.zeros(self.words, dtype='<u8')
+                np.bitwise_or.at(bits, new[:,1]//64, np.left_shift(1, new[:,1]%64).astype('<u8'))
+                peers.append(blank)
+                peer_bits.append(np.broadcast_to(bits, (len(blank), self.words)))
+                pending+=len(blank)
+            if pending>=1<<20:
+                self.eliminate(np.concatenate(peers), np.concatenate(peer_bits))
+                peers, peer_bits, pending = [], [], 0
+        if peers:
+            self.eliminate(np.concatenate(peers), np.concatenate(peer_bits))
+
+
+    def undo(self, mark):
+        # Undoes the changes in trail after the first mark of them
+
+        while len(self.trail)>mark:
+            squares, bits, nums = self.trail.pop()
+            if bits is not None:
+                self.bits[squares]|=bits
+                self.change_counts(squares, bits, 1)
+            else:
+                self.flat[squares]=0
+                units=self.units_of(squares)
+                np.add.at(self.placed, (units, nums[:,None]), -1)
+                for u, blank in self.by_unit(units, squares):
+                    self.open[u]=np.sort(np.concatenate([self.open[u], blank]))
+        self.broken=False
+
+
+    def solve_step(self):
+        # Fills in every square with only one candidate and every number with only one square left
+        # in a set, all worked out from the same counts. Returns whether it filled anything,
+        # and sets broken if it finds a contradiction instead.
+
+        blank=self.flat==0
+        unplaced=self.placed==0
+        if self.broken or (blank&(self.square_counts==0)).any() or (unplaced&(self.counts==0)).any():
+            self.broken=True
+            return False
+
+        # Squares with only one candidate
+        naked=np.flatnonzero(blank&(self.square_counts==1))
+        bits=self.bits[naked]
+        word=(bits!=0).argmax(axis=1)
+        nums=64*word+bit_index(bits[np.arange(len(naked)), word])
+
+        # Numbers with only one square left in a set, found in the blank squares of the set
+        units, unit_nums = np.nonzero(unplaced&(self.counts==1))
+        hidden=np.empty(len(units), dtype=np.int64)
+        starts=np.flatnonzero(np.diff(units, prepend=-1))
+        for u, start, end in zip(units[starts].tolist(), starts, np.append(starts[1:], len(units))):
+            blank_squares=self.open[u]
+            n=unit_nums[start:end]
+            has=(self.bits[blank_squares][:, n//64]>>(n%64).astype('<u8'))&1
+            hidden[start:end]=blank_squares[has.argmax(axis=0)]
+
+        # A square found more than once has to get the same number every time
+        squares=np.concatenate([naked, hidden])
+        nums=np.concatenate([nums, unit_nums])
+        order=np.lexsort((nums, squares))
+        squares, nums = squares[order], nums[order]
+        first=np.diff(squares, prepend=-1)!=0
+        if (nums[1:]!=nums[:-1])[~first[1:]].any():
+            self.broken=True
+            return False
+        self.fill(squares[first], nums[first])
+        return bool(len(squares))
+
+
+    def propagate(self):
+        # Calls solve_step until it runs out of squares to fill in.
+        # Returns 1 if that solves the puzzle, -1 if it runs into a contradiction, and 0 if it gets stuck.
+
+        while True:
+            self.check_limits()
+            filled=self.solve_step()
+            if self.broken:
+                return -1
+            if not filled:
+                return 0
+            self.num_steps+=1
+            if self.placed.sum()==3*self.size*self.size:
+                return 1
+
+
+    def is_solved(self):
+        # Solved when every square is filled in and nothing clashed
+
+        self.solved=bool(not self.broken and (self.placed==1).all())
+        return self.solved
+
+
+    def solve_loop(self, timeout=None, max_steps=None, max_guesses=None, cancel=None):
+        # Solves the puzzle with solve_step, guessing on the blank square with the fewest candidates whenever
+        # it gets stuck and going back to the last guess with candidates left whenever it runs into a
+        # contradiction. Takes the same limits and returns the same status as Sudoku_Puzzle.solve_loop,
+        # and when it stops early the guesses in progress are undone.
+
+        self.deadline=None if timeout is None else time.perf_counter()+timeout
+        self.max_steps=max_steps
+        self.max_guesses=max_guesses
+        self.cancel=cancel
+        # The guesses that still have other candidates to try, as [trail length, square, numbers left]
+        stack=[]
+        try:
+            state=self.propagate()
+            while state!=1:
+                if state==0:
+                    if self.trail is None:
+                        self.trail=[]
+                    self.max_rule=5
+                    counts=np.where(self.flat==0, self.square_counts, self.size+1)
+                    square=int(counts.argmin())
+                    nums=np.flatnonzero(self.unpack_bits(self.bits[square]))
+                    stack.append([len(self.trail), square, nums[::-1].tolist()])
+                else:
+                    self.search_backtracks+=self.trail is not None
+                    while stack and not stack[-1][2]:
+                        stack.pop()
+                    if not stack:
+                        break
+                    self.undo(stack[-1][0])
+
+                self.check_limits(guess=True)
+                mark, square, nums = stack[-1]
+                self.search_nodes+=1
+                self.fill(np.array([square]), np.array([nums.pop()]))
+                state=self.propagate()
+            self.status='solved' if self.is_solved() else 'unsolvable'
+
+        except Solve_Interrupted as interrupted:
+            if stack:
+                self.undo(stack[0][0])
+            self.status=interrupted.status
+        finally:
+            self.trail=None
+            self.deadline=self.max_steps=self.max_guesses=self.cancel=None
+        return self.status
+
+
+    def solve(self, method=None, **limits):
+        # The same as Sudoku_Puzzle.solve for the 'rules' method, which is the only one there is here
+
+        if method not in (None, 'rules'):
+            raise ValueError("Sudoku_Large can only solve with the 'rules' method")
+        self.solve_loop(**limits)
+        return self.is_solved()
+
+
+
+def new_puzzle(grid, block_w=3):
+    # A Sudoku_Puzzle for the grid, or a Sudoku_Large if it's bigger than LARGE_SIZE
+
+    if len(grid)>LARGE_SIZE:
+        return Sudoku_Large(grid, block_w)
+    return Sudoku_Puzzle(grid, block_w)
+
+
+
+@functools.lru_cache(maxsize=None)
+def line_perms(groups, group_len, limit=5000):
+    # Every way of reordering groups*group_len lines (rows or columns) that keeps the lines of each
+    # group together: the groups in any order, and the lines in each group in any order.
+    # Row k of the first array lists the old lines in their new order. In the second, column k
+    # has the weight every line gets when the lines are read as bits in that order, first line highest.
+    # None if there are more than limit orders.
+
+    if math.factorial(groups)*math.factorial(group_len)**groups>limit:
+        return None
+    insides=list(it.permutations(range(group_len)))
+    perms=np.array([[g*group_len+i for g, inside in zip(order, inner) for i in inside]\
+                    for order in it.permutations(range(groups)) for inner in it.product(insides, repeat=groups)])
+    lines=groups*group_len
+    weights=np.zeros((lines, len(perms)))
+    weights[perms, np.arange(len(perms))[:,None]]=2.0**np.arange(lines-1, -1, -1)
+    perms.setflags(write=False)
+    weights.setflags(write=False)
+    return perms, weights
+
+
+def tie_orders(keys):
+    # Every order of the indices of keys, which are already sorted, that keeps them sorted:
+    # the indices of equal keys in any order among themselves
+
+    runs=[list(run) for key, run in it.groupby(range(len(keys)), key=lambda i: keys[i])]
+    for parts in it.product(*[it.permutations(run) for run in runs]):
+        yield [i for part in parts for i in part]
+
+
+def canonical_form(grid, block_w=3, limit=5000):
+    # Maps a puzzle to a grid that all of its symmetric versions map to as well: the ones made by
+    # relabeling the numbers, reordering the rows in a band and the bands, reordering the columns
+    # in a stack and the stacks, and transposing when the blocks are square. Of all of them it picks
+    # the one with the smallest pattern of givens read row by row (counting a given as more than a
+    # blank), and of those, the one with the smallest numbers in reading order after relabeling them
+    # 1, 2, 3, ... in the order they first show up.
+    # Returns the canonical grid and the transform (transposed, rows, cols, nums) that gives it:
+    # see apply_transform.
+    # Every column order is only tried when there aren't too many (up to 9x9 puzzles). Bigger puzzles
+    # only get their numbers relabeled. Puzzles with lots of symmetry only get limit orders of the rows
+    # tried, so a few versions might not map to the same grid. The transform is right either way.
+
+    grid=np.asarray(grid)
+    size=len(grid)
+    block_h=size//block_w
+    cols_perms=line_perms(block_h, block_w) # block_h stacks of block_w columns
+    sources=[grid, grid.T] if block_w==block_h else [grid]
+
+    if cols_perms is None or block_h*size>62:
+        candidates=[(0, np.arange(size), np.arange(size))]
+    else:
+        # The givens in every row after every column order as bits, the first column highest.
+        # Combination k is source k//len(col_perms) with column order k%len(col_perms).
+        col_perms, weights = cols_perms
+        row_bits=np.concatenate([((source>0)@weights).T for source in sources]).astype(np.int64)
+        combos=len(row_bits)
+
+        # The best order of the rows for each: the rows of every band from smallest to biggest,
+        # then the bands from smallest to biggest
+        bands=row_bits.reshape(combos, block_w, block_h)
+        in_band=np.argsort(bands, axis=2, kind='stable')
+        bands=np.take_along_axis(bands, in_band, axis=2)
+        band_keys=(bands<<(size*np.arange(block_h-1, -1, -1))).sum(axis=2)
+        band_order=np.argsort(band_keys, axis=1, kind='stable')
+        band_keys=np.take_along_axis(band_keys, band_order, axis=1)
+
+        # Keep the combinations whose pattern comes out smallest
+        best=np.arange(combos)
+        for i in range(block_w):
+            best=best[band_keys[best,i]==band_keys[best,i].min()]
+
+        # Rows and bands that are the same in the pattern can go in any order among themselves,
+        # so each of those is a candidate too
+        candidates=[]
+        for k in best.tolist():
+            source, cols = divmod(k, len(col_perms))
+            for band_ties in tie_orders(band_keys[k].tolist()):
+                old_bands=band_order[k, band_ties].tolist()
+                row_choices=[[[b*block_h+in_band[k,b,j] for j in ties] for ties in tie_orders(bands[k,b].tolist())]\
+                             for b in old_bands]
+                for parts in it.product(*row_choices):
+                    candidates.append((source, np.concatenate(parts), col_perms[cols]))
+                    if len(candidates)>=limit:
+                        break
+                if len(candidates)>=limit:
+                    break
+            if len(candidates)>=limit:
+                break
+
+    # Relabel the numbers of every candidate in the order they first show up and keep the smallest
+    source=np.array([c[0] for c in candidates])
+    rows=np.array([c[1] for c in candidates])
+    cols=np.array([c[2] for c in candidates])
+    grids=np.stack(sources)[source[:,None,None], rows[:,:,None], cols[:,None,:]].reshape(len(candidates), -1)
+    found=grids[:,:,None]==np.arange(1, size+1)
+    first=np.where(found.any(axis=1), found.argmax(axis=1), size*size+np.arange(size))
+    nums=np.argsort(np.argsort(first, axis=1), axis=1)+1
+    relabeled=np.where(grids>0, np.take_along_axis(nums, np.maximum(grids-1, 0), axis=1), 0)
+    k=np.lexsort(relabeled.T[::-1])[0]
+
+    transform=(bool(source[k]), rows[k], cols[k], np.concatenate([[0], nums[k]]))
+    return relabeled[k].reshape(size, size), transform
+
+
+def apply_transform(grid, transform):
+    # Applies a transform from canonical_form to a grid: transposes it if transposed,
+    # reorders the rows and columns (rows and cols list the old ones in their new order),
+    # and relabels the numbers (the number n becomes nums[n], and nums[0] is 0)
+
+    transposed, rows, cols, nums = transform
+    grid=np.asarray(grid)
+    if transposed:
+        grid=grid.T
+    return nums[grid[np.ix_(rows, cols)]]
+
+
+def undo_transform(grid, transform):
+    # Undoes apply_transform, like for mapping the solution of a canonical grid
+    # back to the puzzle it came from
+
+    transposed, rows, cols, nums = transform
+    old_nums=np.zeros_like(nums)
+    old_nums[nums]=np.arange(len(nums))
+    original=np.zeros_like(grid)
+    original[np.ix_(rows, cols)]=old_nums[grid]
+    return original.T if transposed else original
+
+
+class Sudoku_Cache:
+# A bounded cache of solved and graded puzzles, shared by all the symmetric versions of each puzzle.
+# Puzzles are looked up by their canonical_form, and the solution stored for it is mapped back
+# through the transform. On a miss it's the canonical grid that gets solved, so every version of a
+# puzzle gets the same answer whichever one shows up first. max_rule always comes out the same as
+# solving that version itself, but num_steps can be off by a few, since the rules go through the
+# grid in order. When there are more than max_size puzzles, the one used longest ago is dropped.
+
+    def __init__(self, max_size=10000, method='rules'):
+
+        self.max_size=max_size
+        self.method=method
+        self.entries=collections.OrderedDict() # (size, block_w, canonical grid) -> (solution, solved, num_steps, max_rule)
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+
+
+    def solve(self, grid, block_w=3):
+        # Solves and grades a puzzle, or finds it in the cache if any version of it has been seen.
+        # Returns (solution, solved, num_steps, max_rule).
+
+        canon, transform = canonical_form(grid, block_w)
+        key=(len(canon), block_w, canon.tobytes())
+        entry=self.entries.get(key)
+        if entry is None:
+            self.misses+=1
+            puzzle=Sudoku_Puzzle(canon, block_w, method=self.method)
+            solved=puzzle.solve()
+            entry=(puzzle.grid.copy(), solved, puzzle.num_steps, puzzle.max_rule)
+            self.entries[key]=entry
+            if len(self.entries)>self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions+=1
+        else:
+            self.hits+=1
+            self.entries.move_to_end(key)
+
+        solution, solved, num_steps, max_rule = entry
+        return undo_transform(solution, transform), solved, num_steps, max_rule
+
+
+    def get_stats(self):
+        # The hits, misses, and evictions so far, and how full the cache is
+
+        lookups=self.hits+self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits/lookups if lookups else 0.0,
+                'size': len(self.entries),
+                'max_size': self.max_size}
+
+
+
+def parse_puzzle(line, size=None, block_w=None):
+    # Reads a puzzle written on one line with parse_line (see there for how they're written).
+    # Returns the grid and the block width.
+
+    nums, size, block_w = parse_line(line, size, block_w)
+    return np.array(nums).reshape(size, size), block_w
+
+
+def format_puzzle(grid):
+    # Writes a grid out on one line the way parse_puzzle reads it
+
+    return format_line(np.ravel(grid).tolist(), len(grid))
+
+
+def solve_lines(start, lines, size=None, block_w=None, method='rules', store=None):
+    # Solves a chunk of puzzle lines, numbered from start. Used by the workers of bulk_solve.
+    # Returns (number, solution, solved, num_steps, max_rule) for every line, with max_rule -1
+    # and the error message for the solution if the line couldn't be read.
+    # With store, the directory of a Sudoku_Store, puzzles solved before are looked up there
+    # and the new ones are added to it.
+
+    results=[None]*len(lines)
+    shapes={} # The lines of the chunk grouped by size and block width, so they can be batched
+    for i, line in enumerate(lines):
+        try:
+            grid, w = parse_puzzle(line, size, block_w)
+        except ValueError as error:
+            results[i]=(start+i, "error: %s" % error, False, 0, -1)
+            continue
+        shapes.setdefault((len(grid), w), []).append((i, grid))
+
+    for (n, w), puzzles in shapes.items():
+        if store is not None:
+            puzzle_store=Sudoku_Store(store, n, w)
+            unsolved=[]
+            for i, grid in puzzles:
+                stored=puzzle_store.get(grid, method)
+                if stored is None:
+                    unsolved.append((i, grid))
+                else:
+                    solution, solved, num_steps, max_rule = stored
+                    results[i]=(start+i, format_puzzle(solution), solved, num_steps, max_rule)
+            puzzles=unsolved
+            if not puzzles:
+                puzzle_store.close()
+                continue
+
+        inds=[i for i, grid in puzzles]
+        grids=np.array([grid for i, grid in puzzles])
+        if method=='rules' and n>LARGE_SIZE:
+            solution, solved = np.zeros_like(grids), np.zeros(len(grids), dtype=bool)
+            max_rule, num_steps = np.zeros(len(grids), dtype=int), np.zeros(len(grids), dtype=int)
+            for k, grid in enumerate(grids):
+                puzzle=Sudoku_Large(grid, w)
+                solved[k]=puzzle.solve()
+                solution[k], num_steps[k], max_rule[k] = puzzle.grid, puzzle.num_steps, puzzle.max_rule
+        elif method=='rules':
+            solution, solved, max_rule, num_steps = solve_batch(grids, w)
+        else:
+            solution, solved = np.zeros_like(grids), np.zeros(len(grids), dtype=bool)
+            max_rule, num_steps = np.zeros(len(grids), dtype=int), np.zeros(len(grids), dtype=int)
+            for k, grid in enumerate(grids):
+                puzzle=Sudoku_Puzzle(grid, w, method=method)
+                solved[k]=puzzle.solve()
+                solution[k]=puzzle.grid
+        for k, i in enumerate(inds):
+            results[i]=(start+i, format_puzzle(solution[k]), bool(solved[k]), int(num_steps[k]), int(max_rule[k]))
+
+        if store is not None:
+            puzzle_store.put_many([(grids[k], solution[k], solved[k], num_steps[k], max_rule[k])\
+                                   for k in range(len(grids))], method)
+            puzzle_store.close()
+
+    return results
+
+
+def read_chunks(lines, chunk_size):
+    # Groups the puzzle lines into chunks of chunk_size, skipping blank lines and # comments.
+    # Yields (number of the first puzzle, list of lines) without reading ahead of the chunk.
+
+    chunk=[]
+    count=0
+    for line in lines:
+        line=line.strip()
+        if not line or line.startswith('#'):
+            continue
+        chunk.append(line)
+        if len(chunk)==chunk_size:
+            yield count, chunk
+            count+=len(chunk)
+            chunk=[]
+    if chunk:
+        yield count, chunk
+
+
+def bulk_solve(lines, size=None, block_w=None, method='rules', processes=None,
+               chunk_size=256, max_inflight=None, ordered=True, store=None):
+    # Solves a stream of puzzle lines with a pool of processes and yields the results of solve_lines
+    # one puzzle at a time as they finish. Only max_inflight chunks are handed out at once, so
+    # the memory used stays the same however long the stream is. With ordered, the results come out
+    # in the order of the input, otherwise in the order they finish. With store, every worker
+    # looks puzzles up in and adds them to the Sudoku_Store in that directory.
+
+    processes=processes or os.cpu_count() or 1
+    chunks=read_chunks(lines, chunk_size)
+
+    # Everything in this process if there is only one
+    if processes==1:
+        for start, chunk in chunks:
+            yield from solve_lines(start, chunk, size, block_w, method, store)
+        return
+
+    max_inflight=max_inflight or 2*processes
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        inflight=set()
+        done_chunks={} # Finished chunks waiting for the ones before them, by the number of their first puzzle
+        next_start=0 # The number of the next puzzle to give out when ordered
+        more=True
+        while more or inflight:
+
+            # Keep the pool busy up to max_inflight chunks
+            while more and len(inflight)<max_inflight:
+                chunk=next(chunks, None)
+                if chunk is None:
+                    more=False
+                else:
+                    inflight.add(pool.submit(solve_lines, chunk[0], chunk[1], size, block_w, method, store))
+            if not inflight:
+                break
+
+            done, inflight = concurrent.futures.wait(inflight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                results=future.result()
+                if not ordered:
+                    yield from results
+                else:
+                    done_chunks[results[0][0]]=results
+            while next_start in done_chunks:
+                results=done_chunks.pop(next_start)
+                next_start+=len(results)
+                yield from results
+
+
+def main(argv=None):
+    # Solves the example puzzle below, or with command line arguments, solves a file of puzzles
+    # one per line and writes the number, solution, whether it was solved, num_steps, and max_rule
+    # of every puzzle, separated by tabs
+
+    argv=sys.argv[1:] if argv is None else argv
+    if not argv:
+        example()
+        return
+
+    parser=argparse.ArgumentParser(description="Solve a file of Sudoku puzzles, one per line.")
+    parser.add_argument('input', help="The file of puzzles, or - for stdin")
+    parser.add_argument('-o', '--output', default='-', help="Where to write the solutions (default stdout)")
+    parser.add_argument('--size', type=int, help="The size of the puzzles (default from the length of each line)")
+    parser.add_argument('--block-w', type=int, help="The block width (default the square root of the size)")
+    parser.add_argument('--method', choices=['rules', 'exact_cover'], default='rules',
+                        help="Grade with the rules or just solve with exact cover")
+    parser.add_argument('-j', '--processes', type=int, help="The number of worker processes (default one per CPU)")
+    parser.add_argument('--chunk-size', type=int, default=256, help="The number of puzzles given to a worker at once")
+    parser.add_argument('--max-inflight', type=int, help="The most chunks being solved at once (default twice the processes)")
+    parser.add_argument('--order', choices=['input', 'completion'], default='input',
+                        help="Write the solutions in the order of the input or as they finish")
+    parser.add_argument('--store', help="A directory of stored solutions to look puzzles up in and add them to")
+    args=parser.parse_args(argv)
+
+    infile=sys.stdin if args.input=='-' else open(args.input)
+    outfile=sys.stdout if args.output=='-' else open(args.output, 'w')
+    try:
+        for result in bulk_solve(infile, args.size, args.block_w, args.method, args.processes,
+                                 args.chunk_size, args.max_inflight, args.order=='input', args.store):
+            num, solution, solved, num_steps, max_rule = result
+            outfile.write("%d\t%s\t%d\t%d\t%d\n" % (num, solution, solved, num_steps, max_rule))
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+
+
+def example():
+
+    grid=np.array([[1,7,0,0,0,2,0,9,5],
+                   [4,0,0,0,0,0,0,0,0],
+                   [0,0,0,0,8,0,0,2,0],
+                   [2,5,0,0,0,8,0,0,1],
+                   [0,0,0,3,0,0,6,0,0],
+                   [0,0,9,0,0,0,0,0,0],
+                   [7,9,0,0,6,0,1,0,0],
+                   [0,0,8,0,0,0,0,0,9],
+                   [0,0,4,0,0,7,0,0,0]])
+    
+    puzzle=Sudoku_Puzzle(grid)
+    print("The puzzle: ")
+    print(puzzle.grid)
+    puzzle.solve_loop()
+    print(puzzle.grid)
+    
+    
+if __name__=="__main__":
+
+    main()
+    
     
\ No newline at end of file
@@ -0,0 +1,296 @@
+import argparse
+import glob
+import hashlib
+import os
+import numpy as np
+
+# Only used for locking, so more than one process can add to a store at once.
+# Without it (on Windows) only one process should write to a store at a time.
+try:
+    import fcntl
+except ImportError:
+    fcntl=None
+
+
+# The first numbers in every index file: a magic number, the version, the number of slots,
+# and the size and block width of the puzzles. The slots come after that.
+# The version goes up whenever the way puzzles are graded changes, so old grades aren't handed out.
+MAGIC=0x5544554b4f535431
+VERSION=3
+HEADER=8
+
+
+def record_dtype(size):
+    # The fixed-width record for a puzzle of this size: the key, the solution with one
+    # number per square, num_steps, max_rule, and whether it was solved
+
+    return np.dtype([('key', 'V16'),
+                     ('solution', np.uint8 if size<256 else np.uint16, (size*size,)),
+                     ('num_steps', '<u4'),
+                     ('max_rule', 'i1'),
+                     ('solved', 'u1')])
+
+
+def puzzle_key(grid, method='rules'):
+    # The 16 byte key of a puzzle: a hash of its numbers and the method it was solved with
+
+    grid=np.asarray(grid)
+    nums=grid.astype(np.uint8 if len(grid)<256 else np.uint16)
+    return hashlib.blake2b(method.encode()+b':'+nums.tobytes(), digest_size=16).digest()
+
+
+class Sudoku_Store:
+# Solved and graded puzzles of one size and block width, kept on disk so they survive restarts
+# and can be shared by processes on the same machine. The records are appended to a .dat file,
+# and the .idx file is a hash table of record numbers that is memory-mapped, so a lookup is a few
+# reads from the mapped files without loading or parsing anything.
+# Adding records takes a lock on the .lock file, so any number of processes can add at once.
+# Readers don't lock: a record is written before its slot in the index points to it,
+# and every lookup checks the key of the record, so they never get a wrong answer. At worst they
+# miss something another process just added. Records that get replaced stay in the .dat
+# file until compact() rewrites it.
+
+    def __init__(self, directory, size=9, block_w=3, capacity=1024):
+
+        self.size=size
+        self.block_w=block_w
+        self.dtype=record_dtype(size)
+        os.makedirs(directory, exist_ok=True)
+        base=os.path.join(directory, "%dx%d_%d" % (size, size, block_w))
+        self.idx_path=base+'.idx'
+        self.dat_path=base+'.dat'
+        self.lock_file=open(base+'.lock', 'a')
+        self.index=None
+        self.records=None
+        self.files=None # The (inode, size) of the index and record files when they were mapped
+
+        self.lock()
+        try:
+            header=np.fromfile(self.idx_path, dtype='<i8', count=2).tolist() if os.path.exists(self.idx_path) else None
+            if header is not None and header[0]==MAGIC and header[1]<VERSION:
+                # Made by an older version that graded puzzles differently, so start it over
+                if os.path.exists(self.dat_path):
+                    os.remove(self.dat_path)
+                header=None
+            if header is None:
+                self.rebuild(capacity)
+            self.refresh()
+        finally:
+            self.unlock()
+
+
+    def lock(self):
+        # Waits for the lock on the store, so only one process changes it at a time
+
+        if fcntl is not None:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+
+
+    def unlock(self):
+
+        if fcntl is not None:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+
+    def close(self):
+
+        self.index=None
+        self.records=None
+        self.lock_file.close()
+
+
+    def refresh(self):
+        # Maps the files again if another process replaced them or added records since they were mapped
+
+        idx_stat=os.stat(self.idx_path)
+        dat_stat=os.stat(self.dat_path) if os.path.exists(self.dat_path) else None
+        files=(idx_stat.st_ino, dat_stat and (dat_stat.st_ino, dat_stat.st_size))
+        if files==self.files:
+            return
+
+        if self.files is None or idx_stat.st_ino!=self.files[0]:
+            self.index=np.memmap(self.idx_path, dtype='<i8', mode='r+')
+            magic, version, capacity, size, block_w = self.index[:5].tolist()
+            if magic!=MAGIC or version!=VERSION:
+                raise ValueError("%s isn't a puzzle store index" % self.idx_path)
+            if (size, block_w)!=(self.size, self.block_w):
+                raise ValueError("%s is for puzzles of size %d with blocks %d wide" % (self.idx_path, size, block_w))
+            self.slots=self.index[HEADER:]
+
+        # Only whole records count, in case a process died halfway through writing one
+        count=dat_stat.st_size//self.dtype.itemsize if dat_stat else 0
+        self.records=np.memmap(self.dat_path, dtype=self.dtype, mode='r', shape=(count,)) if count else None
+        self.files=files
+
+
+    def find(self, key):
+        # Looks a key up in the index. Returns (slot, record number), with None for the
+        # record number and the empty slot it would go in if it isn't there.
+
+        mask=len(self.slots)-1
+        slot=int.from_bytes(key[:8], 'little')&mask
+        while True:
+            num=int(self.slots[slot])-1
+            if num<0:
+                return slot, None
+            if self.records is None or num>=len(self.records):
+                self.files=None # Added by another process after the records were mapped
+                self.refresh()
+            if self.records[num]['key'].tobytes()==key:
+                return slot, num
+            slot=(slot+1)&mask
+
+
+    def get(self, grid, method='rules'):
+        # Looks a puzzle up. Returns (solution, solved, num_steps, max_rule), or None if it isn't stored.
+
+        key=puzzle_key(grid, method)
+        slot, num = self.find(key)
+        if num is None:
+            # Maybe the files were replaced by compact() in another process
+            self.refresh()
+            slot, num = self.find(key)
+            if num is None:
+                return None
+        record=self.records[num]
+        return (record['solution'].astype(int).reshape(self.size, self.size), bool(record['solved']),
+                int(record['num_steps']), int(record['max_rule']))
+
+
+    def put(self, grid, solution, solved, num_steps, max_rule, method='rules', replace=False):
+        # Stores one puzzle: see put_many
+
+        self.put_many([(grid, solution, solved, num_steps, max_rule)], method, replace)
+
+
+    def put_many(self, results, method='rules', replace=False):
+        # Stores puzzles given as (grid, solution, solved, num_steps, max_rule), all under one lock.
+        # Puzzles that are already stored are left alone unless replace.
+
+        self.lock()
+        try:
+            self.refresh()
+            new={} # Key -> record, so a puzzle given twice is only written once
+            for grid, solution, solved, num_steps, max_rule in results:
+                key=puzzle_key(grid, method)
+                if not replace and (key in new or self.find(key)[1] is not None):
+                    continue
+                new[key]=(key, np.ravel(solution), num_steps, max_rule, solved)
+            if not new:
+                return
+
+            # Write the records before pointing the index at them, first cutting off
+            # a half-written record left by a process that died while writing it
+            count=0 if self.records is None else len(self.records)
+            if os.path.exists(self.dat_path) and os.path.getsize(self.dat_path)>count*self.dtype.itemsize:
+                os.truncate(self.dat_path, count*self.dtype.itemsize)
+            with open(self.dat_path, 'ab') as f:
+                f.write(np.array(list(new.values()), dtype=self.dtype).tobytes())
+
+            if 2*(count+len(new))>len(self.slots):
+                # More than half full: make a bigger index, which picks up the new records too
+                self.rebuild(2*len(self.slots))
+            else:
+                self.refresh()
+                for i, key in enumerate(new):
+                    slot, num = self.find(key)
+                    self.slots[slot]=count+i+1
+                self.slots.flush()
+            self.refresh()
+        finally:
+            self.unlock()
+
+
+    def rebuild(self, capacity=None):
+        # Writes a new index for the records in the .dat file, with later records of the same puzzle
+        # replacing earlier ones. It gets at least capacity slots, more if it would be over half full.
+        # Has to be called with the lock held.
+
+        count=os.path.getsize(self.dat_path)//self.dtype.itemsize if os.path.exists(self.dat_path) else 0
+        records=np.memmap(self.dat_path, dtype=self.dtype, mode='r', shape=(count,)) if count else\
+                np.zeros(0, dtype=self.dtype)
+        capacity=max(capacity or 1024, 1024)
+        while 2*count>capacity:
+            capacity*=2
+
+        index=np.zeros(HEADER+capacity, dtype='<i8')
+        index[:5]=[MAGIC, VERSION, capacity, self.size, self.block_w]
+        slots=index[HEADER:]
+        mask=capacity-1
+        keys=records['key'].tobytes()
+        for num in range(count):
+            key=keys[16*num:16*num+16]
+            slot=int.from_bytes(key[:8], 'little')&mask
+            while slots[slot] and records[slots[slot]-1]['key'].tobytes()!=key:
+                slot=(slot+1)&mask
+            slots[slot]=num+1
+
+        # Swap the new index in all at once, so readers see either the old one or the new one
+        tmp_path=self.idx_path+'.tmp'
+        index.tofile(tmp_path)
+        os.replace(tmp_path, self.idx_path)
+        self.files=None
+
+
+    def compact(self):
+        # Rewrites the .dat file with only the records the index points to, dropping the ones that
+        # were replaced and any half-written record at the end, and builds a new index for it.
+        # Returns the number of records dropped.
+
+        self.lock()
+        try:
+            self.refresh()
+            count=0 if self.records is None else len(self.records)
+            nums=np.sort(self.slots[self.slots>0]-1)
+            records=np.array(self.records[nums]) if count else np.zeros(0, dtype=self.dtype)
+            tmp_path=self.dat_path+'.tmp'
+            records.tofile(tmp_path)
+            os.replace(tmp_path, self.dat_path)
+            self.rebuild(len(self.slots))
+            self.refresh()
+            return count-len(records)
+        finally:
+            self.unlock()
+
+
+    def __len__(self):
+
+        self.refresh()
+        return int((self.slots>0).sum())
+
+
+def open_stores(directory):
+    # Opens every store in a directory, going by the names of the .idx files
+
+    stores=[]
+    for path in sorted(glob.glob(os.path.join(directory, '*.idx'))):
+        name=os.path.basename(path)[:-4]
+        shape, block_w = name.split('_')
+        stores.append(Sudoku_Store(directory, int(shape.split('x')[0]), int(block_w)))
+    return stores
+
+
+def main(argv=None):
+    # Compacts the stores in a directory, or prints how many puzzles are in them
+
+    parser=argparse.ArgumentParser(description="Look after a directory of stored puzzle solutions.")
+    parser.add_argument('command', choices=['compact', 'stats'])
+    parser.add_argument('directory', help="The directory given to --store")
+    args=parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        parser.error("%s isn't a directory" % args.directory)
+    for store in open_stores(args.directory):
+        name="%dx%d_%d" % (store.size, store.size, store.block_w)
+        if args.command=='compact':
+            dropped=store.compact()
+            print("%s: %d puzzles, dropped %d old records" % (name, len(store), dropped))
+        else:
+            records=0 if store.records is None else len(store.records)
+            print("%s: %d puzzles in %d records, %d index slots" % (name, len(store), records, len(store.slots)))
+        store.close()
+
+
+if __name__=="__main__":
+
+    main()